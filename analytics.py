@@ -0,0 +1,116 @@
+import logging
+import polars as pl
+from sqlalchemy import select
+from database import get_engine, DATABASE_URL
+from models import Tipster, Bet
+from storage import STARTING_BANKROLL
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+DIMENSIONS = ("sport", "league", "market", "month")
+
+BET_SCHEMA = {
+    "id": pl.Int64,
+    "tipster": pl.Utf8,
+    "event_date": pl.Datetime,
+    "sport": pl.Utf8,
+    "league": pl.Utf8,
+    "market": pl.Utf8,
+    "odds": pl.Float64,
+    "result": pl.Utf8,
+    "profit": pl.Float64,
+}
+
+
+def _bets_query(usernames=None):
+    query = (
+        select(
+            Bet.id, Tipster.username.label("tipster"), Bet.event_date, Bet.sport, Bet.league,
+            Bet.market, Bet.odds, Bet.result, Bet.profit
+        )
+        .join(Tipster, Tipster.id == Bet.tipster_id)
+    )
+    if usernames:
+        query = query.where(Tipster.username.in_(list(usernames)))
+    return query
+
+
+def load_bets(usernames=None):
+    """Загружает ставки одного или нескольких капперов в Polars одним запросом"""
+    query = _bets_query(usernames)
+
+    try:
+        # connectorx читает сразу в Arrow - быстрее на миллионах строк
+        import connectorx  # noqa: F401
+        sql = str(query.compile(get_engine(), compile_kwargs={"literal_binds": True}))
+        df = pl.read_database_uri(sql, DATABASE_URL)
+    except ImportError:
+        with get_engine().connect() as conn:
+            df = pl.read_database(query, conn, schema_overrides=BET_SCHEMA)
+
+    if df.is_empty():
+        return pl.DataFrame(schema=BET_SCHEMA)
+    return df.select([pl.col(name).cast(dtype) for name, dtype in BET_SCHEMA.items()])
+
+
+def compute_metrics(df, by=None, starting_bankroll=STARTING_BANKROLL):
+    """Метрики по капперам (и измерениям by): ROI, yield, strike rate, средний коэффициент,
+    банкролл, максимальная просадка и самая длинная серия поражений
+
+    Одна ставка = 1 единица; yield = прибыль / число ставок, ROI = прибыль / поставленные деньги
+    (выигрыши и проигрыши: при возврате ставка возвращается), банкролл считается от стартового.
+    """
+    by = [dim for dim in (by or []) if dim in DIMENSIONS]
+    keys = ["tipster"] + by
+
+    df = df.with_columns([
+        pl.col("profit").fill_null(0.0),
+        pl.col("event_date").dt.strftime("%Y-%m").alias("month"),
+        (pl.col("result") == "Win").alias("is_win"),
+        (pl.col("result") == "Loss").alias("is_loss"),
+    ]).sort(keys + ["event_date", "id"], nulls_last=True)
+
+    # Начало новой серии: сменилась группа или исход (поражение/не поражение)
+    new_run = pl.col("is_loss") != pl.col("is_loss").shift(1)
+    for key in keys:
+        new_run = new_run | (pl.col(key) != pl.col(key).shift(1))
+
+    df = df.with_columns([
+        pl.col("profit").cum_sum().over(keys).alias("bankroll"),
+        new_run.fill_null(True).cum_sum().alias("run_id"),
+    ]).with_columns([
+        (pl.max_horizontal(pl.col("bankroll").cum_max().over(keys), pl.lit(0.0)) - pl.col("bankroll"))
+        .alias("drawdown"),
+        pl.when(pl.col("is_loss")).then(pl.len().over("run_id")).otherwise(0).alias("loss_streak"),
+    ])
+
+    settled = pl.col("is_win").sum() + pl.col("is_loss").sum()
+    metrics = df.group_by(keys).agg([
+        pl.len().alias("bets"),
+        pl.col("is_win").sum().alias("wins"),
+        pl.col("is_loss").sum().alias("losses"),
+        pl.col("profit").sum().round(2).alias("profit"),
+        (pl.col("profit").sum() / pl.len() * 100).round(2).alias("yield"),
+        pl.when(settled > 0).then(pl.col("profit").sum() / settled * 100).otherwise(None)
+        .round(2).alias("roi"),
+        pl.when(settled > 0).then(pl.col("is_win").sum() / settled * 100).otherwise(None)
+        .round(2).alias("strike_rate"),
+        pl.col("odds").mean().round(3).alias("avg_odds"),
+        (pl.col("bankroll").last() + starting_bankroll).round(2).alias("bankroll"),
+        pl.col("drawdown").max().round(2).alias("max_drawdown"),
+        pl.col("loss_streak").max().alias("longest_losing_streak"),
+        pl.col("event_date").min().alias("first_bet"),
+        pl.col("event_date").max().alias("last_bet"),
+    ])
+
+    return metrics.sort(keys, nulls_last=True)
+
+
+def tipster_metrics(usernames=None, by=None):
+    """Метрики для списка капперов в виде списка словарей (для JSON, даты в ISO 8601 как в /stats)"""
+    df = load_bets(usernames)
+    metrics = compute_metrics(df, by).with_columns(
+        pl.col(["first_bet", "last_bet"]).dt.strftime("%Y-%m-%dT%H:%M:%S")
+    )
+    return metrics.to_dicts()
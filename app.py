@@ -1,43 +1,42 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 import os
 import sys
+from datetime import datetime
 
 app = Flask(__name__)
 
-# Проверяем БД
-DB_AVAILABLE = False
-DB_ERROR = ""
-
-try:
-    # Пробуем подключиться к БД
-    import psycopg2
-    DATABASE_URL = os.environ.get('DATABASE_URL', '')
-    if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    
-    if DATABASE_URL:
-        # Простая проверка подключения
-        conn = psycopg2.connect(DATABASE_URL, connect_timeout=10)
-        conn.close()
-        DB_AVAILABLE = True
-    else:
-        DB_ERROR = "DATABASE_URL not set"
-except Exception as e:
-    DB_ERROR = str(e)
-    DB_AVAILABLE = False
+def _db_status():
+    """Состояние БД: проверяется лениво при первом запросе и кэшируется на DB_HEALTH_TTL секунд"""
+    if not os.environ.get('DATABASE_URL'):
+        return False, "DATABASE_URL not set"
+    try:
+        from database import check_db
+        return check_db()
+    except Exception as e:
+        return False, str(e)
 
 @app.route('/')
 def index():
+    db_available, db_error = _db_status()
     return jsonify({
         "status": "online",
         "message": "Tipstrr Analyzer работает!",
-        "database": "available" if DB_AVAILABLE else f"not_available: {DB_ERROR}",
+        "database": "available" if db_available else f"not_available: {db_error}",
         "version": "1.2",
         "endpoints": {
             "/health": "Проверка работы",
             "/status": "Детальный статус",
+            "/metrics": "Метрики Prometheus",
             "/test-db": "Тест БД",
-            "/parse/<username>": "Парсинг каппера"
+            "/parse/<username>": "POST - поставить синхронизацию каппера в очередь, GET - последняя задача",
+            "/jobs/<id>": "Статус и прогресс задачи синхронизации",
+            "/analytics/<username>": "Метрики каппера (?by=sport,league,market,month)",
+            "/analytics": "Метрики нескольких капперов (?tipsters=a,b&by=...)",
+            "/stats/<username>": "Готовые агрегаты каппера (?by=sport,league,month)",
+            "/bets": "Ставки от новых к старым (?tipsters=a,b&sport=&league=&market=&result=&since=&until=&limit=&cursor=)",
+            "/leaderboard": "Рейтинг капперов (?sort=roi|yield|volume|profit&limit=&min_bets=)",
+            "/fixtures/<reference>/consensus": "На что ставили отслеживаемые капперы в событии (по сохраненным завершенным прогнозам)",
+            "/simulate/<username>": "Монте-Карло планов ставок (?paths=&method=bootstrap|permutation&plans=flat,kelly&seed=)"
         }
     })
 
@@ -45,12 +44,19 @@ def index():
 def health():
     return jsonify({"status": "healthy"})
 
+@app.route('/metrics')
+def metrics():
+    # Метрики этого процесса (у каждого воркера gunicorn свои)
+    from metrics import render_metrics
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route('/status')
 def status():
+    db_available, db_error = _db_status()
     return jsonify({
         "python_version": sys.version,
-        "database_available": DB_AVAILABLE,
-        "database_error": DB_ERROR if not DB_AVAILABLE else None,
+        "database_available": db_available,
+        "database_error": db_error if not db_available else None,
         "environment_variables": {
             "TIPSTRR_USERNAME": bool(os.environ.get("TIPSTRR_USERNAME")),
             "DATABASE_URL": bool(os.environ.get("DATABASE_URL"))
@@ -60,22 +66,13 @@ def status():
 @app.route('/test-db')
 def test_db():
     try:
-        import psycopg2
-        DATABASE_URL = os.environ.get('DATABASE_URL', '')
-        if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-            DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-        
-        conn = psycopg2.connect(DATABASE_URL, connect_timeout=10)
-        cursor = conn.cursor()
-        cursor.execute("SELECT version();")
-        db_version = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        # Соединение берется из общего пула SQLAlchemy
+        from database import database_version
         
         return jsonify({
             "success": True,
             "database": "connected",
-            "postgres_version": db_version[0]
+            "postgres_version": database_version()
         })
     except Exception as e:
         return jsonify({
@@ -83,20 +80,212 @@ def test_db():
             "error": str(e)
         })
 
-@app.route('/parse/<username>')
+@app.route('/parse/<username>', methods=['POST'])
 def parse_tipster(username):
-    # Простой парсер без БД
+    # Ставим синхронизацию в очередь и сразу отдаем id задачи
+    try:
+        from jobs import enqueue_sync
+        
+        options = request.get_json(silent=True) or {}
+        max_tips = options.get('max_tips', request.args.get('max_tips'))
+        if isinstance(max_tips, str):
+            if not max_tips.isdigit():
+                raise ValueError("max_tips должен быть положительным целым числом")
+            max_tips = int(max_tips)
+        incremental = options.get('incremental', request.args.get('incremental', '0') in ('1', 'true'))
+        
+        job, created = enqueue_sync(username, max_tips=max_tips, incremental=incremental)
+        return jsonify({
+            "success": True,
+            "merged": not created,
+            "job": job
+        }), 202
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/parse/<username>', methods=['GET'])
+def parse_status(username):
+    try:
+        from jobs import latest_job
+        
+        job = latest_job(username)
+        if not job:
+            return jsonify({"success": False, "error": "Задач для каппера нет"}), 404
+        return jsonify({"success": True, "job": job})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    try:
+        from jobs import get_job
+        
+        job = get_job(job_id)
+        if not job:
+            return jsonify({"success": False, "error": "Задача не найдена"}), 404
+        return jsonify({"success": True, "job": job})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def _analytics_response(usernames):
     try:
-        import requests
+        from analytics import tipster_metrics
         
+        by = [dim.strip() for dim in request.args.get('by', '').split(',') if dim.strip()]
         return jsonify({
             "success": True,
-            "message": f"Парсер для {username} готов",
-            "next": "Добавить логику когда БД заработает"
+            "by": by,
+            "metrics": tipster_metrics(usernames, by)
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+@app.route('/analytics/<username>')
+def analytics_tipster(username):
+    return _analytics_response([username])
+
+@app.route('/analytics')
+def analytics_tipsters():
+    usernames = [u.strip() for u in request.args.get('tipsters', '').split(',') if u.strip()]
+    return _analytics_response(usernames or None)
+
+def _cached_json(key, tipsters, build):
+    """JSON-ответ из кэша API чтения с ETag (If-None-Match -> 304)
+    
+    build() вызывается только при промахе; None означает "не найдено" и не кэшируется.
+    """
+    from cache import read_cache
+    
+    cached = read_cache.get(key)
+    if cached is None:
+        payload = build()
+        if payload is None:
+            return None
+        body = app.json.dumps(payload).encode("utf-8")
+        etag = read_cache.set(key, body, tipsters)
+    else:
+        body, etag = cached
+    
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def _read_db(func, *args, **kwargs):
+    from database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        return func(db, *args, **kwargs)
+    finally:
+        db.close()
+
+def _split_arg(name):
+    return [value.strip() for value in request.args.get(name, '').split(',') if value.strip()]
+
+def _date_arg(name):
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+@app.route('/stats/<username>')
+def tipster_stats(username):
+    try:
+        from storage import get_tipster_stats
+        
+        by = sorted(set(_split_arg('by')))
+        
+        def build():
+            stats = _read_db(get_tipster_stats, username, by)
+            return {"success": True, "stats": stats} if stats else None
+        
+        response = _cached_json(("stats", username, tuple(by)), [username], build)
+        if response is None:
+            return jsonify({"success": False, "error": "Каппер не найден"}), 404
+        return response
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/bets')
+def list_bets():
+    try:
+        from queries import list_bets as query_bets, BET_FILTERS
+        
+        tipsters = sorted(set(_split_arg('tipsters')))
+        filters = {name: request.args.get(name) for name in BET_FILTERS if request.args.get(name)}
+        since, until = _date_arg('since'), _date_arg('until')
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        
+        def build():
+            bets, next_cursor = _read_db(query_bets, tipsters, filters, since, until, limit, cursor)
+            return {"success": True, "bets": bets, "next_cursor": next_cursor}
+        
+        key = ("bets", tuple(tipsters), tuple(sorted(filters.items())), since, until, limit, cursor)
+        return _cached_json(key, tipsters or None, build)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/leaderboard')
+def leaderboard():
+    try:
+        from queries import leaderboard as query_leaderboard
+        
+        sort = request.args.get('sort', 'roi')
+        limit = request.args.get('limit', type=int)
+        min_bets = request.args.get('min_bets', 1, type=int)
+        
+        def build():
+            return {"success": True, "sort": sort, "tipsters": _read_db(query_leaderboard, sort, limit, min_bets)}
+        
+        return _cached_json(("leaderboard", sort, limit, min_bets), None, build)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/fixtures/<reference>/consensus')
+def fixture_consensus(reference):
+    try:
+        from queries import fixture_consensus as query_consensus
+        
+        def build():
+            consensus = _read_db(query_consensus, reference)
+            return {"success": True, "consensus": consensus} if consensus else None
+        
+        # Зависит от прогнозов и прибыли любых капперов - сбрасывается при каждой синхронизации с новыми ставками
+        response = _cached_json(("consensus", reference), None, build)
+        if response is None:
+            return jsonify({"success": False, "error": "Событие не найдено"}), 404
+        return response
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/simulate/<username>')
+def simulate(username):
+    try:
+        from simulation import simulate_tipsters, SIM_PATHS, SIM_METHOD, STAKING_PLANS
+        
+        # В запросе - не больше SIM_PATHS путей и без пула процессов
+        paths = min(request.args.get('paths', SIM_PATHS, type=int), SIM_PATHS)
+        results = simulate_tipsters(
+            [username],
+            n_paths=max(1, paths),
+            method=request.args.get('method', SIM_METHOD),
+            plans=_split_arg('plans') or STAKING_PLANS,
+            workers=1,
+            seed=request.args.get('seed', type=int)
+        )
+        if not results:
+            return jsonify({"success": False, "error": "Ставок каппера нет"}), 404
+        return jsonify({"success": True, "simulation": results[0]})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
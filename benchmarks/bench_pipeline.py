@@ -0,0 +1,252 @@
+"""Бенчмарк конвейера скачивание -> парсинг -> запись
+
+Прогоняет TipstrrParser.parse_tipster и _parse_tip_details против локальной имитации
+tipstrr.com (fake_server.py) на синтетических историях и сохраняет результаты в JSON:
+
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 100000
+    python benchmarks/bench_pipeline.py --sizes 1000 --database postgresql://localhost/bench
+
+Каждый размер запускается в отдельном процессе, чтобы peak RSS и кэши не смешивались.
+Каждый замер синхронизирует нового каппера со своими прогнозами и фикстурами, поэтому в общей
+БД (--database) он не находит ставок и сохраненных ответов прошлых замеров; после замера
+его строки удаляются.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BENCH_TIPSTER_PREFIX = "bench"
+
+
+class RequestCounter:
+    """WSGI-обертка, считающая запросы к имитации по типам эндпоинтов"""
+
+    def __init__(self, app):
+        self.app = app
+        self.counts = {}
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if "/tips/completed" in path:
+            kind = "list"
+        elif "/tips/cached/" in path:
+            kind = "tip"
+        elif "/fixture/" in path:
+            kind = "fixture"
+        else:
+            kind = "login"
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        return self.app(environ, start_response)
+
+    def reset(self):
+        self.counts = {}
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+def _peak_rss_mb():
+    # На Linux ru_maxrss в килобайтах, на macOS - в байтах
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_single(args):
+    """Один замер в текущем процессе; печатает результат JSON в stdout"""
+    sys.path.insert(0, ROOT)
+    from fake_server import create_app, serve_in_thread
+
+    tipster = f"{BENCH_TIPSTER_PREFIX}{uuid.uuid4().hex[:12]}"
+    fixture_prefix = f"{tipster}-fx"
+    counter = RequestCounter(create_app(
+        tips=args.single, page_size=args.page_size, latency=args.latency, fixtures=args.fixtures,
+        fixture_prefix=fixture_prefix,
+    ))
+    server, base_url = serve_in_thread(counter)
+
+    workdir = tempfile.mkdtemp(prefix="tipstrr-bench-")
+    os.environ.update({
+        "TIPSTRR_SITE_URL": base_url,
+        "TIPSTRR_API_URL": base_url + "/api",
+        "TIPSTRR_TRANSPORT": "live",
+        "TIPSTRR_USERNAME": "bench",
+        "TIPSTRR_PASSWORD": "bench",
+        "LIST_PAGE_SIZE": str(args.page_size),
+        "RATE_LIMIT_PER_HOST": "0",
+        "EXPORT_ENABLED": "0",
+        # Конвейер как в продакшене: сырые ответы пишутся, кэш фикстур только в памяти
+        "RAW_STORE_ENABLED": "1",
+        "RAW_REVALIDATE": "0",
+        "FIXTURE_CACHE_PATH": "",
+        "DATABASE_URL": args.database or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+    })
+
+    from sqlalchemy import event
+    from database import get_engine, init_db
+    from parser import TipstrrParser
+    from cache import fixture_cache
+
+    init_db()
+    db_round_trips = [0]
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def count_round_trip(*_):
+        db_round_trips[0] += 1
+
+    try:
+        parser = TipstrrParser(concurrency=args.concurrency)
+        parser.create_session()
+
+        # 1. Полный конвейер
+        counter.reset()
+        started = time.perf_counter()
+        result = parser.parse_tipster(tipster)
+        elapsed = time.perf_counter() - started
+        if not result:
+            raise SystemExit(f"parse_tipster завершился ошибкой: {parser.last_error}")
+
+        pipeline = {
+            "seconds": round(elapsed, 3),
+            "tips_per_sec": round(result["total_bets"] / elapsed, 1),
+            "new_bets": result["new_bets"],
+            "requests": counter.total,
+            "requests_by_endpoint": dict(counter.counts),
+            "requests_per_tip": round(counter.total / max(1, result["total_bets"]), 3),
+            "db_round_trips": db_round_trips[0],
+            "fixture_cache": fixture_cache.stats(),
+            "http_retries": parser.http.retries,
+        }
+
+        # 2. Детали прогнозов последовательно, без кэша фикстур
+        sample = [f"{tipster}-{i:07d}" for i in range(min(args.single, args.detail_sample))]
+        fixture_cache.clear()
+        counter.reset()
+        started = time.perf_counter()
+        parsed = sum(1 for reference in sample if parser._parse_tip_details(reference))
+        elapsed = time.perf_counter() - started
+
+        details = {
+            "tips": len(sample),
+            "parsed": parsed,
+            "seconds": round(elapsed, 3),
+            "tips_per_sec": round(len(sample) / elapsed, 1) if elapsed else None,
+            "requests_per_tip": round(counter.total / max(1, len(sample)), 3),
+        }
+
+        print(json.dumps({
+            "tips": args.single,
+            "pipeline": pipeline,
+            "tip_details": details,
+            "peak_rss_mb": _peak_rss_mb(),
+        }))
+    finally:
+        server.shutdown()
+        if args.database:
+            _cleanup(tipster, fixture_prefix)
+
+
+def _cleanup(tipster, fixture_prefix):
+    """Удаляет из общей БД строки замера (только каппера замера и его фикстуры)"""
+    from database import SessionLocal
+    from models import Tipster, Bet, Fixture, RawResponse, TipsterStats, SyncState, SyncJob
+
+    db = SessionLocal()
+    try:
+        row = db.query(Tipster).filter(Tipster.username == tipster).first()
+        if row is not None:
+            for model in (Bet, TipsterStats, SyncState):
+                db.query(model).filter(model.tipster_id == row.id).delete(synchronize_session=False)
+            db.delete(row)
+        db.query(SyncJob).filter(SyncJob.username == tipster).delete(synchronize_session=False)
+        db.query(RawResponse).filter(
+            (RawResponse.tipster == tipster) | RawResponse.reference.like(f"{fixture_prefix}-%")
+        ).delete(synchronize_session=False)
+        db.query(Fixture).filter(Fixture.reference.like(f"{fixture_prefix}-%")).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк конвейера Tipstrr")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    arg_parser.add_argument("--database", help="URL БД (по умолчанию временная SQLite)")
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    arg_parser.add_argument("--page-size", type=int, default=10)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="Задержка имитации, секунды")
+    arg_parser.add_argument("--fixtures", type=int, default=500)
+    arg_parser.add_argument("--detail-sample", type=int, default=500)
+    arg_parser.add_argument("--output", help="Файл результатов (по умолчанию benchmarks/results/<время>.json)")
+    arg_parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.single:
+        return run_single(args)
+
+    results = []
+    for size in args.sizes:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--single", str(size),
+            "--concurrency", str(args.concurrency), "--page-size", str(args.page_size),
+            "--latency", str(args.latency), "--fixtures", str(args.fixtures),
+            "--detail-sample", str(args.detail_sample),
+        ]
+        if args.database:
+            command += ["--database", args.database]
+
+        print(f"Замер на {size} прогнозах...", file=sys.stderr)
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+
+        pipeline = result["pipeline"]
+        print(f"  {pipeline['tips_per_sec']} прогнозов/с, {pipeline['requests_per_tip']} запросов/прогноз, "
+              f"{pipeline['db_round_trips']} запросов к БД, peak RSS {result['peak_rss_mb']} МБ", file=sys.stderr)
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "database": "postgresql" if args.database and args.database.startswith("postgres") else "sqlite",
+            "concurrency": args.concurrency,
+            "page_size": args.page_size,
+            "latency": args.latency,
+            "fixtures": args.fixtures,
+        },
+        "results": results,
+    }
+
+    output_path = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"Результаты сохранены: {output_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+FIXTURE_CACHE_SIZE = int(os.environ.get("FIXTURE_CACHE_SIZE", "10000"))
+FIXTURE_CACHE_TTL = float(os.environ.get("FIXTURE_CACHE_TTL", str(7 * 24 * 3600)))
+FIXTURE_CACHE_PATH = os.environ.get("FIXTURE_CACHE_PATH", "")
+READ_CACHE_SIZE = int(os.environ.get("READ_CACHE_SIZE", "1000"))
+READ_CACHE_TTL = float(os.environ.get("READ_CACHE_TTL", "300"))
+
+
+class FixtureCache:
+    """LRU-кэш фикстур в памяти с TTL и необязательным хранилищем на диске (SQLite)
+
+    Память защищена своей блокировкой, диск - отдельной, поэтому потоки с попаданием в память
+    не ждут чужого чтения с диска. get_or_load загружает фикстуру один раз, даже если ее
+    одновременно запросили несколько потоков.
+    """
+
+    def __init__(self, max_size=FIXTURE_CACHE_SIZE, ttl=FIXTURE_CACHE_TTL, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}  # reference -> (Event, [payload]) выполняющейся загрузки
+        self._disk = None
+        self._disk_lock = threading.Lock()
+
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS fixtures ("
+                "reference TEXT PRIMARY KEY, payload TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    def _expired(self, stored_at):
+        return self.ttl and time.time() - stored_at > self.ttl
+
+    def _memory_get(self, reference):
+        # Вызывается под self._lock
+        item = self._items.get(reference)
+        if item is None:
+            return None
+        payload, stored_at = item
+        if self._expired(stored_at):
+            del self._items[reference]
+            return None
+        self._items.move_to_end(reference)
+        return payload
+
+    def _disk_get(self, reference):
+        if self._disk is None:
+            return None
+        with self._disk_lock:
+            row = self._disk.execute(
+                "SELECT payload, stored_at FROM fixtures WHERE reference = ?", (reference,)
+            ).fetchone()
+        if not row or self._expired(row[1]):
+            return None
+        payload = json.loads(row[0])
+        with self._lock:
+            self._remember(reference, payload, row[1])
+        return payload
+
+    def get(self, reference, count=True):
+        """Возвращает фикстуру из кэша или None"""
+        with self._lock:
+            payload = self._memory_get(reference)
+            if payload is not None:
+                self.hits += count
+                return payload
+
+        payload = self._disk_get(reference)
+        with self._lock:
+            if payload is not None:
+                self.hits += count
+            else:
+                self.misses += count
+        return payload
+
+    def get_or_load(self, reference, loader):
+        """Фикстура из кэша, иначе loader() - один вызов на reference для всех одновременных запросов
+
+        Пока первый поток загружает фикстуру, остальные ждут его результат (None, если загрузка не удалась).
+        """
+        payload = self.get(reference, count=False)
+        with self._lock:
+            if payload is not None:
+                self.hits += 1
+                return payload
+            loading = self._inflight.get(reference)
+            owner = loading is None
+            if owner:
+                loading = self._inflight[reference] = (threading.Event(), [None])
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        done, result = loading
+        if not owner:
+            done.wait()
+            return result[0]
+
+        try:
+            result[0] = loader()
+            if result[0] is not None:
+                self.set(reference, result[0])
+            return result[0]
+        finally:
+            with self._lock:
+                self._inflight.pop(reference, None)
+            done.set()
+
+    def contains(self, reference):
+        """Есть ли свежая фикстура в памяти (без учета в счетчиках и без обращения к диску)"""
+        with self._lock:
+            item = self._items.get(reference)
+            return item is not None and not self._expired(item[1])
+
+    def set(self, reference, payload):
+        """Сохраняет фикстуру в памяти и (если настроено) на диске"""
+        stored_at = time.time()
+        with self._lock:
+            self._remember(reference, payload, stored_at)
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO fixtures (reference, payload, stored_at) VALUES (?, ?, ?)",
+                    (reference, json.dumps(payload, ensure_ascii=False), stored_at)
+                )
+                self._disk.commit()
+
+    def _remember(self, reference, payload, stored_at):
+        self._items[reference] = (payload, stored_at)
+        self._items.move_to_end(reference)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Очищает кэш и счетчики"""
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM fixtures")
+                self._disk.commit()
+
+    def stats(self):
+        """Счетчики попаданий/промахов (каждое попадание - сэкономленный HTTP-запрос)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Общий кэш для всех экземпляров TipstrrParser в процессе
+fixture_cache = FixtureCache(path=FIXTURE_CACHE_PATH or None)
+
+
+class ResponseCache:
+    """LRU-кэш готовых JSON-ответов API чтения с ETag
+
+    Запись помечается капперами, от данных которых зависит (None - от всех), и сбрасывается
+    через invalidate(username), когда синхронизация этого каппера коммитит новые ставки.
+    TTL ограничивает устаревание в других процессах (воркеры gunicorn, jobs.py), куда сброс не доходит.
+    """
+
+    def __init__(self, max_size=READ_CACHE_SIZE, ttl=READ_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Возвращает (body, etag) или None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                body, etag, _, stored_at = item
+                if not self.ttl or time.time() - stored_at <= self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return body, etag
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, body, tipsters=None):
+        """Сохраняет тело ответа (bytes) и возвращает его ETag"""
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._items[key] = (body, etag, frozenset(tipsters) if tipsters else None, time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return etag
+
+    def invalidate(self, username):
+        """Сбрасывает ответы, зависящие от каппера (включая общие рейтинги)"""
+        with self._lock:
+            stale = [key for key, item in self._items.items() if item[2] is None or username in item[2]]
+            for key in stale:
+                del self._items[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Кэш ответов API чтения (в пределах процесса)
+read_cache = ResponseCache()
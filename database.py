@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -11,13 +13,160 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Настройки пула соединений
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "3"))
+DB_HEALTH_TTL = float(os.environ.get("DB_HEALTH_TTL", "30"))
+
 Base = declarative_base()
 
+_engine = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+_health = {"checked_at": None, "available": False, "error": ""}
+_health_lock = threading.Lock()
+
+# Ключ pg_advisory_lock: миграцию выполняет один процесс, остальные ждут ее окончания
+MIGRATION_LOCK_KEY = 716021
+
+
+def get_engine():
+    """Общий движок с настроенным пулом; создается при первом обращении, а не при импорте"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if not DATABASE_URL:
+                    raise RuntimeError("DATABASE_URL not set")
+
+                options = {"pool_pre_ping": True}
+                if DATABASE_URL.startswith("postgresql"):
+                    options.update(
+                        pool_size=DB_POOL_SIZE,
+                        max_overflow=DB_MAX_OVERFLOW,
+                        pool_timeout=DB_POOL_TIMEOUT,
+                        pool_recycle=DB_POOL_RECYCLE,
+                        connect_args={"connect_timeout": DB_CONNECT_TIMEOUT}
+                    )
+                _engine = create_engine(DATABASE_URL, **options)
+    return _engine
+
+
+def __getattr__(name):
+    # Совместимость: database.engine создается лениво
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(name)
+
+
+def SessionLocal():
+    """Новая сессия на общем пуле соединений"""
+    return _session_factory(bind=get_engine())
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def migrate():
+    """Явная миграция перед запуском приложения (python database.py migrate)
+
+    Доводит схему до моделей (init_db) и заполняет tipster_stats для истории, записанной
+    до появления агрегатов. Веб-воркеры и CLI схему не меняют - это делает только этот шаг.
+    """
+    from storage import backfill_tipster_stats
+
+    engine = get_engine()
+    with engine.connect() as lock_conn:
+        if engine.dialect.name == "postgresql":
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            init_db()
+            db = SessionLocal()
+            try:
+                return backfill_tipster_stats(db)
+            finally:
+                db.close()
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def init_db():
+    """Создает недостающие таблицы, колонки и индексы"""
+    import models  # noqa: F401 - регистрирует модели в Base.metadata
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    
+    # create_all не добавляет индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _add_missing_columns(engine):
+    """Добавляет в существующие таблицы новые колонки моделей (ALTER TABLE ... ADD COLUMN, nullable)"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def check_db(max_age=DB_HEALTH_TTL):
+    """Доступность БД (SELECT 1 через пул); результат кэшируется на max_age секунд
+
+    Возвращает (available, error)
+    """
+    with _health_lock:
+        checked_at = _health["checked_at"]
+        if checked_at is not None and time.monotonic() - checked_at < max_age:
+            return _health["available"], _health["error"]
+
+        try:
+            with get_engine().connect() as conn:
+                conn.execute(text("SELECT 1"))
+            _health.update(available=True, error="")
+        except Exception as e:
+            _health.update(available=False, error=str(e))
+        _health["checked_at"] = time.monotonic()
+        return _health["available"], _health["error"]
+
+
+def database_version():
+    """Версия сервера БД (через общий пул)"""
+    engine = get_engine()
+    query = "SELECT sqlite_version()" if engine.dialect.name == "sqlite" else "SELECT version()"
+    with engine.connect() as conn:
+        return conn.execute(text(query)).scalar()
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    logging.basicConfig(level=logging.INFO)
+    arg_parser = argparse.ArgumentParser(description="Схема БД tipstrr-analyzer")
+    arg_parser.add_argument("command", choices=["migrate"])
+    arg_parser.parse_args()
+
+    # Модели регистрируются в Base модуля database, а не __main__
+    from database import migrate as run_migrate
+
+    rebuilt = run_migrate()
+    logging.getLogger(__name__).info(f"Схема актуальна, агрегаты пересчитаны для {rebuilt} капперов")
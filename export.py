@@ -0,0 +1,254 @@
+import json
+import os
+import shutil
+import uuid
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "data/bets")
+EXPORT_FORMAT = os.environ.get("EXPORT_FORMAT", "parquet")  # parquet или ipc (Arrow/Feather)
+EXPORT_ENABLED = os.environ.get("EXPORT_ENABLED", "1") not in ("0", "false", "no")
+EXPORT_BUFFER_ROWS = int(os.environ.get("EXPORT_BUFFER_ROWS", "10000"))
+
+
+def export_schema():
+    """Схема датасета (polars импортируется только при первой выгрузке)"""
+    import polars as pl
+
+    return {
+        "tipster_id": pl.Int64,
+        "reference": pl.Utf8,
+        "event_date": pl.Datetime,
+        "home_team": pl.Utf8,
+        "away_team": pl.Utf8,
+        "match": pl.Utf8,
+        "sport": pl.Utf8,
+        "league": pl.Utf8,
+        "market": pl.Utf8,
+        "bet": pl.Utf8,
+        "odds": pl.Float64,
+        "result": pl.Utf8,
+        "profit": pl.Float64,
+        "raw_result_code": pl.Int64,
+        "fixture_reference": pl.Utf8,
+        "created_at": pl.Datetime,
+    }
+
+
+_EXTENSIONS = {"parquet": "parquet", "ipc": "arrow"}
+
+
+class ExportWriter:
+    """Дописывает новые ставки синхронизации в датасет, разбитый по tipster=/month=
+
+    Пачки колонок (records.records_to_columns) копятся в ограниченном буфере и сбрасываются
+    отдельными файлами, поэтому каждый запуск только добавляет файлы и ничего не перезаписывает.
+    """
+
+    def __init__(self, username, base_dir=EXPORT_DIR, fmt=EXPORT_FORMAT, buffer_rows=EXPORT_BUFFER_ROWS):
+        if fmt not in _EXTENSIONS:
+            raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+        self.username = username
+        self.base_dir = base_dir
+        self.fmt = fmt
+        self.buffer_rows = buffer_rows
+        self.written = 0
+        self._buffer = []
+        self._buffered = 0
+        self._run_id = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self._part = 0
+        self._closed = False
+
+    def add(self, columns):
+        """columns - словарь {колонка: список значений} по схеме export_schema()"""
+        import polars as pl
+
+        frame = pl.DataFrame(columns, schema=export_schema())
+        self._buffer.append(frame)
+        self._buffered += frame.height
+        if self._buffered >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+
+        import polars as pl
+
+        df = pl.concat(self._buffer, how="vertical", rechunk=True)
+        self._buffer = []
+        self._buffered = 0
+        df = df.with_columns(
+            pl.col("event_date").dt.strftime("%Y-%m").fill_null("unknown").alias("_month")
+        )
+
+        extension = _EXTENSIONS[self.fmt]
+        for (month,), part in df.group_by(["_month"]):
+            directory = os.path.join(self.base_dir, f"tipster={self.username}", f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{self._run_id}_{self._part}.{extension}")
+
+            part = part.drop("_month")
+            if self.fmt == "ipc":
+                part.write_ipc(path, compression="zstd")
+            else:
+                part.write_parquet(path, compression="zstd", statistics=True)
+            self.written += part.height
+
+        self._part += 1
+
+    def close(self):
+        self.flush()
+        if self.written and not self._closed:
+            logger.info(f"Экспортировано {self.written} ставок в {self.base_dir} ({self.fmt})")
+        self._closed = True
+
+
+def rewrite_tipster(db, username, base_dir=EXPORT_DIR, fmt=EXPORT_FORMAT):
+    """Перезаписывает партиции каппера по текущим bets (после перенормализации ставки в датасете устарели)
+
+    Новые файлы пишутся во временный каталог и подменяют tipster=<username> целиком, поэтому
+    читатели видят либо старую, либо новую версию партиций.
+    """
+    from models import Tipster, Bet
+
+    tipster = db.query(Tipster).filter(Tipster.username == username).first()
+    if tipster is None:
+        return 0
+
+    staging = os.path.join(base_dir, f".rewrite-{uuid.uuid4().hex[:8]}")
+    writer = ExportWriter(username, base_dir=staging, fmt=fmt)
+    try:
+        names = list(export_schema())
+        batch = []
+        for bet in db.query(Bet).filter(Bet.tipster_id == tipster.id).order_by(Bet.id).yield_per(EXPORT_BUFFER_ROWS):
+            batch.append(bet)
+            if len(batch) >= EXPORT_BUFFER_ROWS:
+                writer.add({name: [getattr(b, name) for b in batch] for name in names})
+                batch = []
+        if batch:
+            writer.add({name: [getattr(b, name) for b in batch] for name in names})
+        writer.close()
+
+        target = os.path.join(base_dir, f"tipster={username}")
+        retired = f"{staging}-old"
+        if os.path.isdir(target):
+            os.replace(target, retired)
+        written = os.path.join(staging, f"tipster={username}")
+        if os.path.isdir(written):
+            os.replace(written, target)
+        shutil.rmtree(retired, ignore_errors=True)
+        logger.info(f"{username}: партиции датасета перезаписаны ({writer.written} ставок)")
+        return writer.written
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _partition_files(base_dir, extension, tipsters=None, since=None, until=None):
+    """Файлы датасета, чьи партиции tipster=/month= проходят фильтры, -> [(tipster, month, path)]
+
+    Отбор идет по именам каталогов, поэтому файлы чужих капперов и месяцев вообще не открываются.
+    """
+    if not os.path.isdir(base_dir):
+        return []
+    wanted = set(tipsters) if tipsters else None
+    first_month = since.strftime("%Y-%m") if since else None
+    # until не включается: для until=2024-06-01 последний месяц - 2024-05
+    last_month = (until - timedelta(microseconds=1)).strftime("%Y-%m") if until else None
+
+    files = []
+    for tipster_dir in sorted(os.listdir(base_dir)):
+        tipster = tipster_dir.partition("tipster=")[2]
+        if not tipster or (wanted is not None and tipster not in wanted):
+            continue
+        for month_dir in sorted(os.listdir(os.path.join(base_dir, tipster_dir))):
+            month = month_dir.partition("month=")[2]
+            if not month:
+                continue
+            # Ставки без даты (month=unknown) не попадают ни в один период
+            if (first_month or last_month) and month == "unknown":
+                continue
+            if (first_month and month < first_month) or (last_month and month > last_month):
+                continue
+            directory = os.path.join(base_dir, tipster_dir, month_dir)
+            files.extend(
+                (tipster, month, os.path.join(directory, name))
+                for name in sorted(os.listdir(directory)) if name.endswith(f".{extension}")
+            )
+    return files
+
+
+def scan_history(tipsters=None, since=None, until=None, base_dir=EXPORT_DIR, fmt=EXPORT_FORMAT):
+    """Ленивое чтение истории из датасета
+
+    Партиции tipster/month отбираются по путям до сканирования. Каждый файл сканируется отдельно
+    и объединяется диагонально: файлы, записанные до появления новой колонки (fixture_reference),
+    читаются вместе с новыми, а tipster всегда строка (вывод типа по пути сделал бы из "123" число).
+    """
+    import polars as pl
+
+    frames = []
+    for tipster, month, path in _partition_files(base_dir, _EXTENSIONS[fmt], tipsters, since, until):
+        lf = pl.scan_ipc(path, memory_map=False) if fmt == "ipc" else pl.scan_parquet(path, hive_partitioning=False)
+        if since:
+            lf = lf.filter(pl.col("event_date") >= since)
+        if until:
+            lf = lf.filter(pl.col("event_date") < until)
+        frames.append(lf.with_columns([pl.lit(tipster).alias("tipster"), pl.lit(month).alias("month")]))
+
+    if not frames:
+        schema = dict(export_schema(), tipster=pl.Utf8, month=pl.Utf8)
+        return pl.DataFrame(schema=schema).lazy()
+    return pl.concat(frames, how="diagonal")
+
+
+def export_excel(username, filename=None, base_dir=EXPORT_DIR):
+    """Выгрузка истории каппера в Excel по запросу (из датасета, без обращения к БД)"""
+    import polars as pl
+
+    df = scan_history([username], base_dir=base_dir).sort("event_date").collect()
+    if df.is_empty():
+        return None
+
+    df = df.with_columns(pl.lit(datetime.now().strftime('%Y-%m-%d %H:%M:%S')).alias('parsed_at'))
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = filename or f"{username}_bets_{timestamp}.xlsx"
+
+    try:
+        df.write_excel(
+            workbook=filename,
+            worksheet="bets",
+            autofit=True,
+            has_header=True
+        )
+        logger.info(f"Данные сохранены в Excel: {filename}")
+        return filename
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении в Excel: {e}")
+        # Если не получилось в Excel, сохраняем в JSON
+        return _save_to_json(df.to_dicts(), username)
+
+
+def _save_to_json(data, username):
+    """Резервное сохранение в JSON"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"{username}_bets_{timestamp}.json"
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+
+    logger.info(f"Данные сохранены в JSON: {filename}")
+    return filename
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Использование: python export.py <username> [файл.xlsx]")
+        sys.exit(1)
+
+    print(export_excel(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
@@ -0,0 +1,145 @@
+import argparse
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from flask import Flask, jsonify, request
+
+# КОНФИГУРАЦИЯ ПО УМОЛЧАНИЮ
+DEFAULT_TIPS = 1000
+DEFAULT_FIXTURES = 500
+SPORTS = [("Football", ["Premier League", "La Liga", "Serie A", "Bundesliga"]),
+          ("Tennis", ["ATP Tour", "WTA Tour"]),
+          ("Basketball", ["NBA", "EuroLeague"])]
+MARKETS = [("Match Result", ["Home", "Draw", "Away"]),
+           ("Over/Under 2.5", ["Over 2.5", "Under 2.5"]),
+           ("Both Teams To Score", ["Yes", "No"])]
+EPOCH = datetime(2025, 1, 1)
+
+
+def _rng(*parts):
+    """Детерминированный генератор для ключа (одни и те же данные при каждом запросе)"""
+    return random.Random(zlib.crc32("/".join(str(p) for p in parts).encode()))
+
+
+def create_app(tips=DEFAULT_TIPS, page_size=10, latency=0.0, error_rate=0.0,
+               fixtures=DEFAULT_FIXTURES, seed=0, fixture_prefix="fx"):
+    """Локальная имитация API tipstrr.com: логин, список, детали прогноза и фикстуры
+
+    tips - число прогнозов у каждого каппера (или dict username -> число),
+    latency - задержка ответа в секундах, error_rate - доля ответов 503,
+    fixture_prefix - префикс fixtureReference (свой префикс - свои фикстуры, не пересекающиеся с прошлыми).
+    """
+    app = Flask(__name__)
+    errors = random.Random(seed)
+
+    def tips_for(username):
+        return tips.get(username, DEFAULT_TIPS) if isinstance(tips, dict) else tips
+
+    def tip_date(index):
+        # index 0 - самый новый прогноз
+        return EPOCH - timedelta(hours=6 * index)
+
+    @app.before_request
+    def simulate_network():
+        if latency:
+            time.sleep(latency)
+        if error_rate and errors.random() < error_rate:
+            return jsonify({"error": "Service Unavailable"}), 503
+
+    @app.route("/")
+    def home():
+        return "ok"
+
+    @app.route("/login", methods=["POST"])
+    def login():
+        return jsonify({"success": True})
+
+    @app.route("/api/portfolio/<username>/tips/completed")
+    def tips_completed(username):
+        skip = int(request.args.get("skip", 0))
+        total = tips_for(username)
+        page = range(skip, min(skip + page_size, total))
+        return jsonify([
+            {"reference": f"{username}-{i:07d}", "tipDate": tip_date(i).isoformat() + "Z"}
+            for i in page
+        ])
+
+    @app.route("/api/portfolio/<account>/tips/cached/<reference>")
+    def tip_cached(account, reference):
+        username, _, index = reference.rpartition("-")
+        if not username or not index.isdigit() or int(index) >= tips_for(username):
+            return jsonify({"error": "Not Found"}), 404
+
+        i = int(index)
+        rng = _rng(seed, reference)
+        fixture = rng.randrange(fixtures)
+        market, selections = rng.choice(MARKETS)
+        odds = round(rng.uniform(1.3, 4.5), 2)
+        result = rng.choices([1, 2, 3], weights=[1 / odds, 1 - 1 / odds, 0.05])[0]
+        profit = round(odds - 1, 2) if result == 1 else (-1.0 if result == 2 else 0.0)
+        fixture_rng = _rng(seed, "fixture", fixture)
+
+        return jsonify({
+            "reference": reference,
+            "title": f"Team {fixture_rng.randrange(100)} v Team {fixture_rng.randrange(100, 200)}",
+            "tipDate": tip_date(i).isoformat() + "Z",
+            "result": result,
+            "profit": profit,
+            "tipBet": [{"odds": odds}],
+            "tipBetItem": [{
+                "fixtureReference": f"{fixture_prefix}-{fixture}",
+                "marketText": market,
+                "betText": rng.choice(selections)
+            }]
+        })
+
+    @app.route("/api/fixture/<reference>")
+    def fixture(reference):
+        number = reference.rpartition("-")[2]
+        if not number.isdigit() or int(number) >= fixtures:
+            return jsonify({"error": "Not Found"}), 404
+
+        rng = _rng(seed, "fixture", int(number))
+        sport, leagues = rng.choice(SPORTS)
+        return jsonify({
+            "reference": reference,
+            "homeTeam": {"name": f"Team {rng.randrange(100)}"},
+            "awayTeam": {"name": f"Team {rng.randrange(100, 200)}"},
+            "sport": {"name": sport},
+            "competition": {"name": rng.choice(leagues)}
+        })
+
+    return app
+
+
+def serve_in_thread(app, host="127.0.0.1", port=0):
+    """Запускает приложение в фоновом потоке; возвращает (server, base_url)"""
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Локальная имитация API tipstrr.com")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--tips", type=int, default=DEFAULT_TIPS, help="Прогнозов у каждого каппера")
+    arg_parser.add_argument("--page-size", type=int, default=10)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, секунды")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    arg_parser.add_argument("--fixtures", type=int, default=DEFAULT_FIXTURES)
+    args = arg_parser.parse_args()
+
+    app = create_app(args.tips, args.page_size, args.latency, args.error_rate, args.fixtures)
+    print(f"Запуск: TIPSTRR_SITE_URL=http://{args.host}:{args.port} "
+          f"TIPSTRR_API_URL=http://{args.host}:{args.port}/api LIST_PAGE_SIZE={args.page_size}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import threading
+import time
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", "8"))
+RATE_LIMIT_PER_HOST = float(os.environ.get("RATE_LIMIT_PER_HOST", "10"))
+
+
+class RateLimiter:
+    """Ограничитель частоты запросов (token bucket) отдельно для каждого хоста"""
+
+    def __init__(self, rate=RATE_LIMIT_PER_HOST, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """Блокирует поток, пока для хоста из url не появится свободный токен"""
+        if not self.rate or self.rate <= 0:
+            return
+
+        host = urlsplit(url).netloc
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, updated = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+
+                self._buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class ConcurrentFetcher:
+    """Пул потоков для параллельной загрузки; результаты в порядке входных данных"""
+
+    def __init__(self, max_workers=FETCH_CONCURRENCY):
+        self.max_workers = max(1, int(max_workers))
+
+    def map(self, func, items):
+        """Применяет func ко всем items и возвращает список результатов в исходном порядке"""
+        items = list(items)
+        if not items:
+            return []
+
+        # Последовательный путь (резервный вариант)
+        if self.max_workers == 1 or len(items) == 1:
+            return [func(item) for item in items]
+
+        workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tipstrr-fetch") as pool:
+            return list(pool.map(func, items))
+
+
+class RequestBudgetExceeded(Exception):
+    """Исчерпан общий лимит запросов"""
+
+
+class RequestBudget(RateLimiter):
+    """Общий бюджет запросов для нескольких воркеров: лимит частоты + (опционально) общий лимит"""
+
+    def __init__(self, rate=RATE_LIMIT_PER_HOST, max_requests=None, burst=None):
+        super().__init__(rate=rate, burst=burst)
+        self.max_requests = max_requests
+        self.used = 0
+        self._count_lock = threading.Lock()
+
+    def acquire(self, url):
+        with self._count_lock:
+            if self.max_requests is not None and self.used >= self.max_requests:
+                raise RequestBudgetExceeded(f"Исчерпан бюджет запросов ({self.max_requests})")
+            self.used += 1
+        super().acquire(url)
@@ -0,0 +1,204 @@
+import email.utils
+import os
+from collections import deque
+import random
+import threading
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from transport import make_transport
+from metrics import HTTP_REQUESTS, HTTP_LATENCY, HTTP_RETRIES, endpoint_kind
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+SITE_URL = os.environ.get("TIPSTRR_SITE_URL", "https://www.tipstrr.com").rstrip("/")
+LOGIN_URL = os.environ.get("LOGIN_URL", SITE_URL + "/login")
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "5"))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "30"))
+RELOGIN_LIMIT = int(os.environ.get("RELOGIN_LIMIT", "3"))  # повторных логинов за окно RELOGIN_WINDOW
+RELOGIN_WINDOW = float(os.environ.get("RELOGIN_WINDOW", "300"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Только 401 означает истекшую сессию; 403 (нет доступа к платному прогнозу и т.п.) отдается как есть
+AUTH_STATUSES = {401}
+
+
+def _retry_after(response):
+    """Значение заголовка Retry-After в секундах (число или HTTP-дата)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+class SessionManager:
+    """Общая авторизованная HTTP-сессия: пул соединений, таймауты, ретраи и повторный логин"""
+
+    def __init__(self, username, password, pool_size=HTTP_POOL_SIZE, session=None):
+        self.username = username
+        self.password = password
+        self.timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        self.max_retries = HTTP_MAX_RETRIES
+        self.logged_in = False
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+        self._login_generation = 0
+        self._login_lock = threading.Lock()
+        self._relogins = deque()  # время повторных логинов в окне RELOGIN_WINDOW
+
+        self.session = session or make_transport()
+        # Офлайн-режим (воспроизведение архива): без лимитов частоты и ретраев
+        self.offline = getattr(self.session, "offline", False)
+        if self.offline:
+            self.max_retries = 0
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept': 'application/json, text/plain, */*',
+            'Accept-Language': 'en-US,en;q=0.9',
+        })
+
+    def login(self):
+        """Логинится на tipstrr.com; куки остаются в общей сессии"""
+        # Получаем начальные куки
+        self.session.get(SITE_URL, timeout=self.timeout)
+
+        login_data = {
+            "username": self.username,
+            "password": self.password
+        }
+
+        login_headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Origin': SITE_URL,
+            'Referer': LOGIN_URL,
+        }
+
+        with HTTP_LATENCY.time(endpoint="login"):
+            response = self.session.post(LOGIN_URL, data=login_data, headers=login_headers, timeout=self.timeout)
+        HTTP_REQUESTS.inc(endpoint="login", status=response.status_code)
+
+        if response.status_code != 200:
+            logger.error(f"Ошибка авторизации: {response.status_code}")
+            self.logged_in = False
+            return False
+
+        logger.info("Авторизация успешна")
+        self.logged_in = True
+        self._login_generation += 1
+        return True
+
+    def ensure_logged_in(self):
+        """Логинится один раз на процесс; параллельные вызовы ждут первый логин"""
+        if self.logged_in:
+            return True
+        with self._login_lock:
+            return self.logged_in or self.login()
+
+    def _relogin(self, seen_generation):
+        """Повторный логин после истечения сессии
+        
+        Один логин на поколение: потоки, получившие 401 на том же поколении, ждут его результат.
+        Не больше RELOGIN_LIMIT логинов за RELOGIN_WINDOW секунд, чтобы отклоненная учетная запись
+        не превращалась в цикл логинов.
+        """
+        with self._login_lock:
+            if self._login_generation != seen_generation:
+                return self.logged_in
+            
+            now = time.monotonic()
+            while self._relogins and now - self._relogins[0] > RELOGIN_WINDOW:
+                self._relogins.popleft()
+            if len(self._relogins) >= RELOGIN_LIMIT:
+                logger.error(f"Превышен лимит повторных логинов ({RELOGIN_LIMIT} за {RELOGIN_WINDOW:.0f} с)")
+                return False
+            self._relogins.append(now)
+            
+            logger.warning("Сессия истекла, авторизуюсь заново")
+            return self.login()
+
+    def get(self, url, rate_limiter=None, **kwargs):
+        """GET с таймаутом, экспоненциальным backoff на 429/5xx, Retry-After и повторным логином"""
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = endpoint_kind(url)
+        relogged = False
+        attempt = 0
+
+        while True:
+            if rate_limiter is not None and not self.offline:
+                rate_limiter.acquire(url)
+
+            generation = self._login_generation
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                HTTP_REQUESTS.inc(endpoint=endpoint, status="error")
+                if attempt >= self.max_retries:
+                    raise
+                delay = _backoff(attempt)
+                HTTP_RETRIES.inc(endpoint=endpoint, reason="connection")
+                logger.warning(f"{url}: {e}, повтор через {delay:.1f} с")
+            else:
+                HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+                HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+
+                # После повторного логина тот же статус возвращается без новой попытки
+                if response.status_code in AUTH_STATUSES and not relogged:
+                    relogged = True
+                    HTTP_RETRIES.inc(endpoint=endpoint, reason="relogin")
+                    if self._relogin(generation):
+                        continue
+                    return response
+
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+
+                retry_after = _retry_after(response)
+                if retry_after is not None and retry_after > HTTP_BACKOFF_MAX:
+                    # Сервер просит ждать дольше допустимой паузы - повтор раньше срока снова получит отказ
+                    logger.warning(f"{url}: HTTP {response.status_code}, Retry-After {retry_after:.0f} с "
+                                   f"больше HTTP_BACKOFF_MAX, без повтора")
+                    return response
+                delay = retry_after if retry_after is not None else _backoff(attempt)
+                HTTP_RETRIES.inc(endpoint=endpoint, reason=str(response.status_code))
+                logger.warning(f"{url}: HTTP {response.status_code}, повтор через {delay:.1f} с")
+
+            attempt += 1
+            with self._retries_lock:
+                self.retries += 1
+            time.sleep(delay)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_session_manager(username, password):
+    """Общий SessionManager для учетной записи (одна авторизация на процесс)"""
+    with _managers_lock:
+        manager = _managers.get(username)
+        if manager is None or manager.password != password:
+            manager = SessionManager(username, password)
+            _managers[username] = manager
+        return manager
@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from fetcher import RequestBudget
+from models import SyncJob
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_RUNNER = os.environ.get("JOB_RUNNER", "inprocess")  # inprocess или external (python jobs.py)
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+PROGRESS_UPDATE_INTERVAL = float(os.environ.get("PROGRESS_UPDATE_INTERVAL", "1"))
+JOB_STALE_TIMEOUT = float(os.environ.get("JOB_STALE_TIMEOUT", "900"))  # секунд без heartbeat -> задача мертва
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_executor = None
+_budget = None
+_lock = threading.Lock()
+
+
+def _ensure_ready():
+    """Создает пул воркеров при первом обращении (схему заранее готовит python database.py migrate)
+    
+    Новый пул (после рестарта воркера gunicorn или деплоя) сразу подбирает задачи,
+    оставшиеся в очереди, и закрывает зависшие
+    """
+    global _executor, _budget
+    started_pool = False
+    with _lock:
+        if _budget is None:
+            _budget = RequestBudget()
+        if _executor is None and JOB_RUNNER == "inprocess":
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="tipstrr-job")
+            started_pool = True
+
+    if started_pool:
+        recover_stale_jobs()
+        for job_id in queued_job_ids():
+            _executor.submit(run_job, job_id)
+
+
+def recover_stale_jobs(username=None, timeout=JOB_STALE_TIMEOUT):
+    """Помечает failed задачи running без heartbeat дольше timeout (воркер умер посреди синхронизации)"""
+    deadline = datetime.utcnow() - timedelta(seconds=timeout)
+    db = SessionLocal()
+    try:
+        query = db.query(SyncJob).filter(
+            SyncJob.status == "running",
+            ((SyncJob.updated_at.is_(None)) & (SyncJob.started_at < deadline)) | (SyncJob.updated_at < deadline)
+        )
+        if username:
+            query = query.filter(SyncJob.username == username)
+        recovered = query.update({
+            "status": "failed",
+            "error": f"Нет heartbeat дольше {int(timeout)} с (воркер перезапущен или упал)",
+            "finished_at": datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        if recovered:
+            logger.warning(f"Зависших задач помечено failed: {recovered}")
+        return recovered
+    except Exception as e:
+        logger.error(f"Не удалось восстановить зависшие задачи: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+
+def queued_job_ids():
+    db = SessionLocal()
+    try:
+        return [row[0] for row in
+                db.query(SyncJob.id).filter(SyncJob.status == "queued").order_by(SyncJob.id).all()]
+    finally:
+        db.close()
+
+
+def _active_job(db, username):
+    return (
+        db.query(SyncJob)
+        .filter(SyncJob.username == username, SyncJob.status.in_(ACTIVE_STATUSES))
+        .order_by(SyncJob.id)
+        .first()
+    )
+
+
+def job_to_dict(job):
+    return {
+        "job_id": job.id,
+        "username": job.username,
+        "status": job.status,
+        "progress": {
+            "pages_fetched": job.pages_fetched or 0,
+            "tips_processed": job.tips_processed or 0,
+            "new_bets": job.new_bets or 0
+        },
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def enqueue_sync(username, max_tips=None, incremental=False):
+    """Ставит синхронизацию в очередь; повторный запрос для того же каппера сливается с активной задачей
+
+    Возвращает (словарь задачи, created); ValueError - некорректные max_tips / incremental
+    """
+    if max_tips is not None and (isinstance(max_tips, bool) or not isinstance(max_tips, int) or max_tips < 1):
+        raise ValueError("max_tips должен быть положительным целым числом")
+    if not isinstance(incremental, bool):
+        raise ValueError("incremental должен быть true или false")
+    _ensure_ready()
+    recover_stale_jobs(username)
+
+    db = SessionLocal()
+    try:
+        job = _active_job(db, username)
+        if job:
+            return job_to_dict(job), False
+
+        # Уникальный частичный индекс uq_sync_jobs_active_username не даст создать вторую активную задачу,
+        # даже если запросы пришли одновременно в разные процессы
+        job = SyncJob(username=username, status="queued", max_tips=max_tips, incremental=incremental)
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            job = _active_job(db, username)
+            if job is None:
+                raise
+            return job_to_dict(job), False
+        db.refresh(job)
+
+        if _executor is not None:
+            _executor.submit(run_job, job.id)
+        logger.info(f"Задача {job.id}: синхронизация {username} поставлена в очередь")
+        return job_to_dict(job), True
+    finally:
+        db.close()
+
+
+def get_job(job_id):
+    _ensure_ready()
+
+    db = SessionLocal()
+    try:
+        job = db.query(SyncJob).filter(SyncJob.id == job_id).first()
+        return job_to_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def latest_job(username):
+    _ensure_ready()
+
+    db = SessionLocal()
+    try:
+        job = db.query(SyncJob).filter(SyncJob.username == username).order_by(SyncJob.id.desc()).first()
+        return job_to_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def _update_job(job_id, **fields):
+    db = SessionLocal()
+    try:
+        db.query(SyncJob).filter(SyncJob.id == job_id).update(fields, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Не удалось обновить задачу {job_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _claim_job(job_id):
+    """Атомарно переводит задачу queued -> running (одна задача - один воркер)"""
+    db = SessionLocal()
+    try:
+        claimed = (
+            db.query(SyncJob)
+            .filter(SyncJob.id == job_id, SyncJob.status == "queued")
+            .update({"status": "running", "started_at": datetime.utcnow(), "updated_at": datetime.utcnow()},
+                    synchronize_session=False)
+        )
+        db.commit()
+        if not claimed:
+            return None
+        return db.query(SyncJob).filter(SyncJob.id == job_id).first()
+    finally:
+        db.close()
+
+
+def run_job(job_id):
+    """Выполняет задачу синхронизации и пишет прогресс в sync_jobs"""
+    from scheduler import sync_tipster
+
+    job = _claim_job(job_id)
+    if job is None:
+        return
+
+    last_update = [0.0]
+
+    def on_progress(progress):
+        # Не чаще раза в PROGRESS_UPDATE_INTERVAL секунд
+        now = time.monotonic()
+        if now - last_update[0] < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_update[0] = now
+        _update_job(job_id, pages_fetched=progress["pages"], tips_processed=progress["tips"],
+                    new_bets=progress["new_bets"], updated_at=datetime.utcnow())
+
+    try:
+        result = sync_tipster(job.username, _budget, max_tips=job.max_tips, incremental=job.incremental,
+                              progress_callback=on_progress)
+    except Exception as e:
+        result = {"status": "failed", "error": str(e), "total_bets": 0, "new_bets": 0}
+
+    fields = {"status": result["status"], "error": result["error"], "finished_at": datetime.utcnow(),
+              "updated_at": datetime.utcnow()}
+    if result["status"] == "done":
+        fields.update(tips_processed=result["total_bets"], new_bets=result["new_bets"])
+    _update_job(job_id, **fields)
+    logger.info(f"Задача {job_id}: {result['status']}")
+
+
+def worker_loop():
+    """Отдельный процесс-воркер: забирает задачи queued из БД (JOB_RUNNER=external)"""
+    _ensure_ready()
+    logger.info(f"Воркер задач запущен ({JOB_WORKERS} потоков)")
+
+    submitted = set()
+    with ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="tipstrr-job") as pool:
+        while True:
+            recover_stale_jobs()
+            queued = queued_job_ids()
+
+            # run_job сам пропустит задачи, уже занятые другим воркером
+            for job_id in queued:
+                if job_id not in submitted:
+                    submitted.add(job_id)
+                    pool.submit(run_job, job_id)
+            time.sleep(JOB_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    worker_loop()
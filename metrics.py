@@ -0,0 +1,244 @@
+import argparse
+import bisect
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """Счетчик с метками (монотонно растет)"""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными бакетами (в секундах)"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [counts по бакетам, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {round(total, 6)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class Registry:
+    """Набор метрик процесса + функции, которые считают gauge-значения при выдаче"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        """func() -> список (имя, описание, значение) для gauge-метрик"""
+        self._collectors.append(func)
+
+    def render(self):
+        """Текстовый формат Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрик: {e}")
+                continue
+            for name, documentation, value in gauges:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "tipstrr_http_requests_total", "HTTP-запросы к tipstrr.com по типу эндпоинта и статусу",
+    ["endpoint", "status"]))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "tipstrr_http_request_duration_seconds", "Длительность HTTP-запросов", ["endpoint"]))
+HTTP_RETRIES = REGISTRY.register(Counter(
+    "tipstrr_http_retries_total", "Повторы HTTP-запросов", ["endpoint", "reason"]))
+DB_LATENCY = REGISTRY.register(Histogram(
+    "tipstrr_db_operation_duration_seconds", "Длительность операций с БД", ["operation"]))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "tipstrr_pipeline_stage_duration_seconds", "Длительность стадий синхронизации", ["stage"]))
+SYNC_RESULTS = REGISTRY.register(Counter(
+    "tipstrr_syncs_total", "Завершенные синхронизации капперов", ["status"]))
+TIPS_PROCESSED = REGISTRY.register(Counter(
+    "tipstrr_tips_total", "Прогнозы: найдены в списке / записаны как новые ставки", ["kind"]))
+
+
+def endpoint_kind(url):
+    """Тип эндпоинта tipstrr по URL (для меток метрик)"""
+    path = urlsplit(url).path
+    if "/tips/completed" in path:
+        return "list"
+    if "/tips/cached/" in path:
+        return "tip"
+    if "/fixture/" in path:
+        return "fixture"
+    if path.rstrip("/").endswith("/login"):
+        return "login"
+    if path in ("", "/"):
+        return "home"
+    return "other"
+
+
+def _fixture_cache_stats():
+    from cache import fixture_cache
+
+    stats = fixture_cache.stats()
+    return [
+        ("tipstrr_fixture_cache_hits", "Попадания в кэш фикстур", stats["hits"]),
+        ("tipstrr_fixture_cache_misses", "Промахи кэша фикстур", stats["misses"]),
+        ("tipstrr_fixture_cache_hit_ratio", "Доля попаданий в кэш фикстур", stats["hit_rate"]),
+        ("tipstrr_fixture_cache_size", "Фикстур в памяти", stats["size"]),
+    ]
+
+
+def _read_cache_stats():
+    from cache import read_cache
+
+    stats = read_cache.stats()
+    return [
+        ("tipstrr_read_cache_hits", "Ответы API чтения из кэша", stats["hits"]),
+        ("tipstrr_read_cache_misses", "Ответы API чтения, потребовавшие запроса к БД", stats["misses"]),
+        ("tipstrr_read_cache_size", "Ответов API чтения в кэше", stats["size"]),
+    ]
+
+
+REGISTRY.add_collector(_fixture_cache_stats)
+REGISTRY.add_collector(_read_cache_stats)
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+def profile_sync(username, output=None, engine="cprofile", **kwargs):
+    """Профилирует одну синхронизацию каппера (cProfile или pyinstrument)"""
+    from parser import TipstrrParser
+
+    parser = TipstrrParser()
+
+    if engine == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            result = parser.parse_tipster(username, **kwargs)
+        finally:
+            profiler.stop()
+        output = output or f"{username}_profile.html"
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    else:
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        try:
+            result = profiler.runcall(parser.parse_tipster, username, **kwargs)
+        finally:
+            output = output or f"{username}.prof"
+            profiler.dump_stats(output)
+        pstats.Stats(output).sort_stats("cumulative").print_stats(25)
+
+    logger.info(f"Профиль сохранен: {output}")
+    return result, output
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Профилирование одной синхронизации каппера")
+    arg_parser.add_argument("username")
+    arg_parser.add_argument("--max-tips", type=int)
+    arg_parser.add_argument("--pyinstrument", action="store_true")
+    arg_parser.add_argument("--output")
+    args = arg_parser.parse_args()
+
+    profile_sync(args.username, args.output, "pyinstrument" if args.pyinstrument else "cprofile",
+                 max_tips=args.max_tips)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import (
+    Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index, LargeBinary, UniqueConstraint, text
+)
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -35,7 +37,133 @@ class Bet(Base):
     result = Column(String)  # Win/Loss/Void
     profit = Column(Float)
     raw_result_code = Column(Integer)
+    fixture_reference = Column(String)  # Событие tipstrr (fixtureReference), см. Fixture
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     # Связь с каппером
     tipster = relationship("Tipster", back_populates="bets")
+    
+    __table_args__ = (
+        # История каппера по датам и выборки по измерениям без полного сканирования
+        Index("ix_bets_tipster_event_date", "tipster_id", "event_date", "id"),
+        Index("ix_bets_tipster_sport", "tipster_id", "sport"),
+        Index("ix_bets_tipster_league", "tipster_id", "league"),
+        Index("ix_bets_event_date", "event_date", "id"),
+        # Все прогнозы на событие - консенсус капперов
+        Index("ix_bets_fixture_tipster", "fixture_reference", "tipster_id"),
+    )
+
+class Fixture(Base):
+    """Событие tipstrr; ставки ссылаются на него через Bet.fixture_reference"""
+    __tablename__ = "fixtures"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    reference = Column(String, unique=True, index=True)
+    home_team = Column(String)
+    away_team = Column(String)
+    sport = Column(String)
+    league = Column(String)
+    event_date = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class RawResponse(Base):
+    """Исходный JSON ответа tipstrr (прогноз или фикстура) - для повторной нормализации без сети"""
+    __tablename__ = "raw_responses"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # tip/fixture
+    reference = Column(String, nullable=False)
+    tipster = Column(String)  # username каппера (для прогнозов)
+    status = Column(String, nullable=False)  # ok/failed
+    status_code = Column(Integer)
+    content = Column(LargeBinary)  # Тело ответа, сжатое zlib
+    content_hash = Column(String(64))  # sha256 несжатого тела
+    etag = Column(String)
+    last_modified = Column(String)
+    error = Column(String)
+    attempts = Column(Integer, default=1)
+    fetched_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("kind", "reference", name="uq_raw_responses_kind_reference"),
+        Index("ix_raw_responses_tipster_status", "tipster", "kind", "status"),
+    )
+
+class TipsterStats(Base):
+    """Агрегаты по ставкам каппера, обновляются при каждой вставке ставок
+    
+    dimension="all" - итог по капперу, sport/league/month - разрезы (dimension_value - значение)
+    """
+    __tablename__ = "tipster_stats"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tipster_id = Column(Integer, ForeignKey("tipsters.id"), nullable=False)
+    dimension = Column(String, nullable=False, default="all")
+    dimension_value = Column(String, nullable=False, default="")
+    
+    bets = Column(Integer, default=0)
+    wins = Column(Integer, default=0)
+    losses = Column(Integer, default=0)
+    voids = Column(Integer, default=0)
+    profit = Column(Float, default=0.0)
+    odds_sum = Column(Float, default=0.0)  # Для среднего коэффициента
+    odds_count = Column(Integer, default=0)
+    first_bet = Column(DateTime)
+    last_bet = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    tipster = relationship("Tipster")
+    
+    __table_args__ = (
+        UniqueConstraint("tipster_id", "dimension", "dimension_value", name="uq_tipster_stats_key"),
+    )
+
+class SyncState(Base):
+    __tablename__ = "sync_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tipster_id = Column(Integer, ForeignKey("tipsters.id"), unique=True, index=True)
+    last_reference = Column(String)  # Самый новый сохраненный прогноз (high-water mark)
+    last_tip_date = Column(DateTime)
+    last_synced_at = Column(DateTime)
+    
+    # Результат последнего запуска (пакетная синхронизация)
+    status = Column(String)  # running/done/failed
+    last_error = Column(String)
+    last_started_at = Column(DateTime)
+    last_duration = Column(Float)  # секунды
+    last_total_bets = Column(Integer)
+    last_new_bets = Column(Integer)
+    
+    # Контрольная точка незавершенного полного прохода
+    checkpoint_skip = Column(Integer)  # Смещение страницы, до которой все закоммичено
+    checkpoint_reference = Column(String)  # Последний закоммиченный прогноз
+    
+    tipster = relationship("Tipster")
+
+class SyncJob(Base):
+    __tablename__ = "sync_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, index=True)
+    status = Column(String, index=True, default="queued")  # queued/running/done/failed
+    max_tips = Column(Integer)
+    incremental = Column(Boolean, default=False)
+    
+    # Прогресс
+    pages_fetched = Column(Integer, default=0)
+    tips_processed = Column(Integer, default=0)
+    new_bets = Column(Integer, default=0)
+    error = Column(String)
+    
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)  # Heartbeat выполняющейся задачи
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (
+        # Не больше одной активной задачи на каппера - повторные запросы сливаются с ней
+        Index("uq_sync_jobs_active_username", "username", unique=True,
+              postgresql_where=text("status IN ('queued', 'running')"),
+              sqlite_where=text("status IN ('queued', 'running')")),
+    )
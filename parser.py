@@ -1,26 +1,58 @@
-import requests
-import polars as pl  # ← ИМЕННО ЭТО ИЗМЕНЕНИЕ
 from datetime import datetime
+import itertools
 import time
+from collections import deque
 import os
-import json
-from sqlalchemy.orm import Session
-from models import Tipster, Bet
 from database import SessionLocal
+from http_client import get_session_manager
+from fetcher import ConcurrentFetcher, RateLimiter, RequestBudgetExceeded, FETCH_CONCURRENCY
+from cache import fixture_cache, read_cache
+from raw_store import (
+    RawStore, load_stored, conditional_headers, failed_references, failed_fixture_references, renormalize_tipster,
+    RAW_STORE_ENABLED, RAW_REVALIDATE
+)
+from records import TipRecord, json_loads, tip_fixture_reference, records_to_rows, records_to_columns, records_to_fixtures
+from export import ExportWriter, export_excel, EXPORT_ENABLED
+from metrics import STAGE_LATENCY, DB_LATENCY, SYNC_RESULTS, TIPS_PROCESSED
+from storage import (
+    existing_references, bulk_insert_bets, bulk_insert_fixtures, get_or_create_tipster, get_or_create_sync_state,
+    ensure_tipster_stats
+)
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # КОНФИГУРАЦИЯ (вынести в config.py или переменные окружения)
-LOGIN_URL = os.environ.get("LOGIN_URL", "https://www.tipstrr.com/login")
-API_LIST_URL_TEMPLATE = "https://tipstrr.com/api/portfolio/{username}/tips/completed"
-API_TIP_URL_TEMPLATE = "https://tipstrr.com/api/portfolio/{username}/tips/cached"
-API_FIXTURE_URL = "https://tipstrr.com/api/fixture"
+API_BASE_URL = os.environ.get("TIPSTRR_API_URL", "https://tipstrr.com/api").rstrip("/")
+API_LIST_URL_TEMPLATE = API_BASE_URL + "/portfolio/{username}/tips/completed"
+API_TIP_URL_TEMPLATE = API_BASE_URL + "/portfolio/{username}/tips/cached"
+API_FIXTURE_URL = API_BASE_URL + "/fixture"
+LIST_PAGE_SIZE = int(os.environ.get("LIST_PAGE_SIZE", "10"))
+DETAIL_BUFFER_SIZE = int(os.environ.get("DETAIL_BUFFER_SIZE", "50"))
+COMMIT_CHUNK_SIZE = int(os.environ.get("COMMIT_CHUNK_SIZE", "200"))
+RECENT_PAGES = 2  # страниц, по которым отсеиваются повторы сдвинутого списка
+
+
+def _chunked(items, size):
+    """Разбивает итератор на списки длиной не более size"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 class TipstrrParser:
-    def __init__(self):
+    def __init__(self, concurrency=FETCH_CONCURRENCY, rate_limiter=None):
         self.session = None
+        self.http = None
+        self.last_error = None
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.raw_store = RawStore() if RAW_STORE_ENABLED else None
         self.username = os.environ.get("TIPSTRR_USERNAME")
         self.password = os.environ.get("TIPSTRR_PASSWORD")
         
@@ -29,308 +61,443 @@ class TipstrrParser:
             raise ValueError("Укажите TIPSTRR_USERNAME и TIPSTRR_PASSWORD")
     
     def create_session(self):
-        """Создает сессию с авторизацией"""
-        self.session = requests.Session()
+        """Получает общую авторизованную сессию (логин выполняется один раз на процесс)"""
+        self.http = get_session_manager(self.username, self.password)
+        if not self.http.ensure_logged_in():
+            return False
         
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'en-US,en;q=0.9',
-        })
+        self.session = self.http.session
+        return True
+    
+    def _get(self, url, **kwargs):
+        """GET-запрос с ограничением частоты, таймаутом, ретраями и повторным логином"""
+        return self.http.get(url, rate_limiter=self.rate_limiter, **kwargs)
+    
+    def fetch_tip_details(self, references, concurrency=None, stored=None, tipster=None, db=None):
+        """Загружает детали нескольких прогнозов параллельно, сохраняя порядок references
         
-        # Получаем начальные куки
-        self.session.get("https://www.tipstrr.com")
+        stored - сохраненные ответы {reference: StoredResponse}: по ним прогноз берется без запроса.
+        Сначала параллельно загружаются прогнозы, затем в текущем потоке через db одним запросом
+        читаются сохраненные фикстуры буфера, и только потом параллельно загружаются недостающие
+        фикстуры - потоки загрузки к БД не обращаются.
+        """
+        workers = self.concurrency if concurrency is None else concurrency
+        fetcher = ConcurrentFetcher(max_workers=workers)
+        stored = stored or {}
+        tips = fetcher.map(lambda reference: self._fetch_tip(reference, stored.get(reference), tipster), references)
+        stored_fixtures = self._load_stored_fixtures(db, tips)
+        return fetcher.map(
+            lambda item: self._build_record(item[0], item[1], stored_fixtures), list(zip(references, tips))
+        )
+    
+    def _load_stored_fixtures(self, db, tips):
+        """Сохраненные фикстуры прогнозов буфера, которых нет в кэше -> {reference: StoredResponse}"""
+        if db is None or self.raw_store is None:
+            return {}
+        references = {tip_fixture_reference(tip_data) for tip_data in tips if tip_data}
+        return load_stored(db, "fixture", [
+            reference for reference in references if reference and not fixture_cache.contains(reference)
+        ])
+    
+    def parse_tipster(self, username, max_tips=None, concurrency=None, incremental=False, save_excel=False,
+                      resume=True, export=EXPORT_ENABLED, progress_callback=None):
+        """Парсит данные конкретного каппера
         
-        # Логинимся
-        login_data = {
-            "username": self.username,
-            "password": self.password
-        }
+        Работает как потоковый конвейер: страницы списка -> детали -> нормализация -> запись в БД.
+        Каждая стадия обрабатывает элементы по мере поступления, коммит идет чанками,
+        поэтому память не растет с историей, а прерванный запуск сохраняет уже записанное.
         
-        login_headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Origin': 'https://www.tipstrr.com',
-            'Referer': 'https://www.tipstrr.com/login',
-        }
+        incremental=True - останавливает пагинацию на первой странице, где все прогнозы
+        уже есть в БД (или встречается сохраненный high-water mark)
         
-        response = self.session.post(LOGIN_URL, data=login_data, headers=login_headers)
+        resume=True - полный проход продолжается с контрольной точки (checkpoint_skip),
+        оставшейся после упавшего или прерванного запуска. Перед этим инкрементально читается
+        голова списка: она дает новый high-water mark и прогнозы, появившиеся после сбоя
         
-        if response.status_code != 200:
-            logger.error(f"Ошибка авторизации: {response.status_code}")
-            return False
+        export=True - новые ставки дописываются в Parquet-датасет (export.py),
+        save_excel=True - после синхронизации история выгружается в Excel
         
-        logger.info("Авторизация успешна")
-        return True
-    
-    def parse_tipster(self, username, max_tips=None):
-        """Парсит данные конкретного каппера"""
-        if not self.session:
-            if not self.create_session():
+        progress_callback(progress) - вызывается после каждой страницы и каждого коммита
+        со словарем pages / tips / new_bets
+        """
+        self.last_error = None
+        if not self.http:
+            with STAGE_LATENCY.time(stage="login"):
+                logged_in = self.create_session()
+            if not logged_in:
+                self.last_error = "Ошибка авторизации"
+                SYNC_RESULTS.inc(status="failed")
                 return None
         
+        started = time.perf_counter()
         db = SessionLocal()
+        writer = ExportWriter(username) if export else None
         try:
             # Проверяем, есть ли каппер в БД
-            tipster = db.query(Tipster).filter(Tipster.username == username).first()
-            if not tipster:
-                tipster = Tipster(
-                    username=username,
-                    name=username,
-                    profile_url=f"https://tipstrr.com/tipster/{username}"
-                )
-                db.add(tipster)
+            tipster = get_or_create_tipster(db, username)
+            sync_state = get_or_create_sync_state(db, tipster.id)
+            # Дальше агрегаты обновляются при вставке; история до tipster_stats пересчитывается один раз
+            if ensure_tipster_stats(db, tipster.id):
                 db.commit()
-                db.refresh(tipster)
+                read_cache.invalidate(username)
             
             # Получаем список прогнозов
             logger.info(f"Загружаю прогнозы для {username}...")
             api_url = API_LIST_URL_TEMPLATE.format(username=username)
             
-            all_tips = []
-            skip = 0
+            progress = {"pages": 0, "tips": 0, "new_bets": 0, "newest_tip": None}
+            head_progress = {"pages": 0, "tips": 0, "newest_tip": None}
+            head = ()
+            start_skip = 0
+            if resume and not incremental and sync_state.checkpoint_skip:
+                start_skip = sync_state.checkpoint_skip
+                # Прогнозы до контрольной точки уже перечислены и сохранены прошлым запуском
+                progress["tips"] = start_skip
+                logger.info(f"Продолжаю с контрольной точки skip={start_skip} ({sync_state.checkpoint_reference})")
+                # Голова списка до первой сохраненной страницы; контрольная точка при этом не сдвигается
+                head_pages = self._iter_list_pages(api_url, head_progress)
+                head = self._iter_new_references(
+                    db, ((start_skip, batch) for _, batch in head_pages), sync_state, incremental=True
+                )
+            
+            pages = self._iter_list_pages(api_url, progress, max_tips, start_skip, progress_callback)
+            references = itertools.chain(head, self._iter_new_references(db, pages, sync_state, incremental))
+            details = self._iter_tip_details(references, concurrency, db, username)
+            records = self._iter_records(details)
             
-            while True:
-                response = self.session.get(api_url, params={'skip': skip})
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка API: {response.status_code}")
-                    break
-                
-                batch = response.json()
-                if not batch:
-                    break
-                
-                all_tips.extend(batch)
-                
-                # Если указано ограничение
-                if max_tips and len(all_tips) >= max_tips:
-                    all_tips = all_tips[:max_tips]
-                    break
-                
-                # Если пришло меньше 10 - последняя страница
-                if len(batch) < 10:
-                    break
+            # Записываем чанками - каждый чанк сразу коммитится вместе с контрольной точкой
+            for chunk in _chunked(records, COMMIT_CHUNK_SIZE):
+                chunk_records = [record for _, record in chunk]
+                created_at = datetime.utcnow()
+                with STAGE_LATENCY.time(stage="persist"):
+                    bulk_insert_fixtures(db, records_to_fixtures(chunk_records))
+                    inserted = bulk_insert_bets(db, records_to_rows(chunk_records, tipster.id, created_at))
+                    progress["new_bets"] += inserted
+                    
+                    # Все страницы до skip последней записи чанка обработаны полностью
+                    sync_state.checkpoint_skip, last_record = chunk[-1]
+                    sync_state.checkpoint_reference = last_record.reference
+                    if self.raw_store is not None:
+                        self.raw_store.flush(db)
+                    with DB_LATENCY.time(operation="commit"):
+                        db.commit()
+                if inserted:
+                    # Ответы API чтения по этому капперу устарели
+                    read_cache.invalidate(username)
+                TIPS_PROCESSED.inc(inserted, kind="new")
+                if progress_callback:
+                    progress_callback(progress)
                 
-                skip += 10
-                time.sleep(0.1)
-            
-            logger.info(f"Найдено {len(all_tips)} прогнозов")
+                if writer is not None:
+                    with STAGE_LATENCY.time(stage="export"):
+                        writer.add(records_to_columns(chunk_records, tipster.id, created_at))
             
-            # СОЗДАЕМ POLARS DATAFRAME ДЛЯ АНАЛИЗА (опционально)
-            if all_tips:
-                df = pl.DataFrame(all_tips)
-                logger.info(f"Создан Polars DataFrame: {df.shape}")
+            # Обновляем high-water mark (список отдается от новых к старым)
+            newest_tip = progress["newest_tip"] or head_progress["newest_tip"]
+            if newest_tip:
+                sync_state.last_reference = newest_tip.get('reference')
+                sync_state.last_tip_date = self._parse_tip_date(newest_tip.get('tipDate'))
+            sync_state.last_synced_at = datetime.utcnow()
             
-            # Обрабатываем каждый прогноз
-            new_bets = 0
-            for tip in all_tips:
-                reference = tip.get('reference')
-                
-                # Проверяем, есть ли уже в БД
-                existing = db.query(Bet).filter(Bet.reference == reference).first()
-                if existing:
-                    continue
-                
-                # Парсим детали
-                bet_data = self._parse_tip_details(reference)
-                if bet_data:
-                    # Преобразуем дату
-                    try:
-                        event_date = datetime.strptime(bet_data['event_date'], '%Y-%m-%d')
-                    except:
-                        event_date = None
-                    
-                    # Создаем запись ставки
-                    bet = Bet(
-                        tipster_id=tipster.id,
-                        reference=reference,
-                        event_date=event_date,
-                        home_team=bet_data.get('home_team', ''),
-                        away_team=bet_data.get('away_team', ''),
-                        match=bet_data.get('match', ''),
-                        sport=bet_data.get('sport', ''),
-                        league=bet_data.get('league', ''),
-                        market=bet_data.get('market', ''),
-                        bet=bet_data.get('bet', ''),
-                        odds=float(bet_data.get('odds', 0)) if bet_data.get('odds') else None,
-                        result=bet_data.get('result', ''),
-                        profit=float(bet_data.get('profit', 0)) if bet_data.get('profit') else 0,
-                        raw_result_code=int(bet_data.get('raw_result_code', 0))
-                    )
-                    
-                    db.add(bet)
-                    new_bets += 1
+            # Полный проход завершен - контрольная точка больше не нужна
+            if not incremental:
+                sync_state.checkpoint_skip = None
+                sync_state.checkpoint_reference = None
             
+            if self.raw_store is not None:
+                self.raw_store.flush(db)
             db.commit()
-            logger.info(f"Добавлено {new_bets} новых ставок для {username}")
+            logger.info(f"Найдено {progress['tips']} прогнозов на {progress['pages']} страницах")
+            logger.info(f"Добавлено {progress['new_bets']} новых ставок для {username}")
+            logger.info(f"Кэш фикстур: {fixture_cache.stats()}")
             
-            # ДОПОЛНИТЕЛЬНО: СОХРАНИМ В EXCEL ДЛЯ АНАЛИЗА (если нужно)
-            self._save_to_excel(all_tips, username)
+            # ДОПОЛНИТЕЛЬНО: ВЫГРУЗКА В EXCEL ПО ЗАПРОСУ
+            if save_excel:
+                if writer is not None:
+                    writer.close()
+                with STAGE_LATENCY.time(stage="excel"):
+                    export_excel(username)
             
+            STAGE_LATENCY.observe(time.perf_counter() - started, stage="sync")
+            SYNC_RESULTS.inc(status="done")
             return {
                 "tipster": tipster.username,
-                "total_bets": len(all_tips),
-                "new_bets": new_bets
+                "total_bets": progress["tips"],
+                "new_bets": progress["new_bets"]
             }
             
         except Exception as e:
             logger.error(f"Ошибка при парсинге: {e}")
+            self.last_error = str(e)
             db.rollback()
+            SYNC_RESULTS.inc(status="failed")
             return None
         finally:
+            # Закоммиченные ставки попадают в датасет даже при ошибке
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception as e:
+                    logger.error(f"Ошибка при экспорте: {e}")
             db.close()
     
-    def _parse_tip_details(self, reference):
-        """Внутренний метод парсинга деталей ставки"""
-        try:
-            # 1. Получаем детали прогноза (ставки)
-            tip_url = f"https://tipstrr.com/api/portfolio/{self.username}/tips/cached/{reference}"
-            response_tip = self.session.get(tip_url)
-
-            if response_tip.status_code != 200:
-                logger.error(f"Ошибка при запросе прогноза {reference}: {response_tip.status_code}")
-                return None
-
-            tip_data = response_tip.json()
-
-            # 2. Получаем детали матча (фикстуры)
-            fixture_data = None
-            fixture_reference = None
+    def _iter_list_pages(self, api_url, progress, max_tips=None, start_skip=0, progress_callback=None):
+        """Стадия 1: отдает страницы /tips/completed по одной в виде (skip, batch)"""
+        skip = start_skip
+        
+        while True:
+            with STAGE_LATENCY.time(stage="list"):
+                response = self._get(api_url, params={'skip': skip})
+                
+                # Ошибка посреди списка - прерываем запуск, контрольная точка сохранится
+                if response.status_code != 200:
+                    raise RuntimeError(f"Ошибка API: {response.status_code} (skip={skip})")
+                
+                batch = json_loads(response.content)
+            if not batch:
+                return
             
-            if tip_data.get('tipBetItem') and len(tip_data['tipBetItem']) > 0:
-                fixture_reference = tip_data['tipBetItem'][0].get('fixtureReference')
+            # Если указано ограничение
+            if max_tips and progress["tips"] + len(batch) >= max_tips:
+                batch = batch[:max_tips - progress["tips"]]
             
-            if fixture_reference:
-                fixture_url = f"{API_FIXTURE_URL}/{fixture_reference}"
-                response_fixture = self.session.get(fixture_url)
-
-                if response_fixture.status_code == 200:
-                    fixture_data = response_fixture.json()
-
-            # Извлекаем данные
-            title = tip_data.get('title', '')
-            tip_date = tip_data.get('tipDate', '')
-            result = tip_data.get('result', '')
-            profit = tip_data.get('profit', '')
-
-            # Обработка даты
-            event_date = ''
-            event_time = ''
-            if tip_date:
-                try:
-                    dt = datetime.fromisoformat(tip_date.replace('Z', '+00:00'))
-                    event_date = dt.strftime('%Y-%m-%d')
-                    event_time = dt.strftime('%H:%M')
-                except:
-                    event_date = tip_date[:10] if len(tip_date) >= 10 else tip_date
-                    event_time = ''
-
-            # Данные о ставке
-            odds = None
-            market_text = ''
-            bet_text = ''
-
-            if tip_data.get('tipBet') and len(tip_data['tipBet']) > 0:
-                odds = tip_data['tipBet'][0].get('odds', '')
-
-            if tip_data.get('tipBetItem') and len(tip_data['tipBetItem']) > 0:
-                market_text = tip_data['tipBetItem'][0].get('marketText', '')
-                bet_text = tip_data['tipBetItem'][0].get('betText', '')
-
-            # Данные о матче из фикстуры (если есть)
-            home_team = ''
-            away_team = ''
-            sport = ''
-            league = ''
-
-            if fixture_data:
-                home_team = fixture_data.get('homeTeam', {}).get('name', '')
-                away_team = fixture_data.get('awayTeam', {}).get('name', '')
-                sport = fixture_data.get('sport', {}).get('name', '')
-                league = fixture_data.get('competition', {}).get('name', '')
-
-            # Если нет данных из фикстуры, пробуем извлечь из title
-            if not home_team and ' v ' in title:
-                parts = title.split(' v ')
-                if len(parts) == 2:
-                    home_team = parts[0].strip()
-                    away_team = parts[1].strip()
-
-            # Расшифровка результата
-            result_map = {1: 'Win', 2: 'Loss', 3: 'Void'}
-            result_text = result_map.get(result, f'Unknown ({result})')
-
-            return {
-                'event_date': event_date,
-                'event_time': event_time,
-                'home_team': home_team,
-                'away_team': away_team,
-                'match': f"{home_team} vs {away_team}" if home_team and away_team else title,
-                'sport': sport,
-                'league': league,
-                'market': market_text,
-                'bet': bet_text,
-                'odds': odds,
-                'result': result_text,
-                'profit': profit,
-                'raw_result_code': result,
-                'reference': reference
-            }
+            if skip == 0:
+                progress["newest_tip"] = batch[0]
+            progress["pages"] += 1
+            progress["tips"] += len(batch)
+            TIPS_PROCESSED.inc(len(batch), kind="listed")
+            if progress_callback:
+                progress_callback(progress)
+            yield skip, batch
             
-        except Exception as e:
-            logger.error(f"Ошибка при парсинге деталей {reference}: {e}")
-            return None
+            if max_tips and progress["tips"] >= max_tips:
+                return
+            
+            # Если пришло меньше LIST_PAGE_SIZE - последняя страница
+            if len(batch) < LIST_PAGE_SIZE:
+                return
+            
+            skip += LIST_PAGE_SIZE
     
-    def _save_to_excel(self, data, username):
-        """Сохранение данных в Excel через polars"""
-        if not data:
-            return
+    def _iter_new_references(self, db, pages, sync_state, incremental=False):
+        """Стадия 2: отфильтровывает прогнозы, которые уже есть в БД (один запрос на страницу)
         
-        try:
-            # Создаем DataFrame из данных
-            df = pl.DataFrame(data)
+        Новый прогноз посреди длинного прохода сдвигает список, и хвост страницы повторяется
+        на следующей - такие references (еще не закоммиченные) отсеиваются по двум последним
+        страницам, поэтому память не зависит от длины истории
+        """
+        recent = deque(maxlen=RECENT_PAGES)
+        for skip, batch in pages:
+            batch_references = list(dict.fromkeys(tip.get('reference') for tip in batch if tip.get('reference')))
+            seen = set().union(*recent)
+            known = existing_references(db, [ref for ref in batch_references if ref not in seen])
+            new_references = [ref for ref in batch_references if ref not in known and ref not in seen]
+            recent.append(set(batch_references))
+            
+            # Вся страница уже в БД - дальше только более старые прогнозы
+            if incremental and not new_references:
+                logger.info("Инкрементальный режим: страница уже сохранена, останавливаюсь")
+                return
             
-            # Добавляем информацию о каппере
-            df = df.with_columns([
-                pl.lit(username).alias('tipster'),
-                pl.lit(datetime.now().strftime('%Y-%m-%d %H:%M:%S')).alias('parsed_at')
-            ])
+            for reference in new_references:
+                yield skip, reference
             
-            # Сохраняем в Excel
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{username}_bets_{timestamp}.xlsx"
+            # Дошли до high-water mark прошлой синхронизации
+            if incremental and sync_state.last_reference and sync_state.last_reference in batch_references:
+                logger.info(f"Инкрементальный режим: найден последний сохраненный прогноз {sync_state.last_reference}")
+                return
+    
+    def _iter_tip_details(self, references, concurrency=None, db=None, tipster=None):
+        """Стадия 3: загружает детали параллельно ограниченными буферами, сохраняя порядок
+        
+        Сохраненные ответы буфера (прогнозы и их фикстуры) читаются из raw_responses в текущем потоке
+        и в сеть не идут
+        """
+        for chunk in _chunked(references, DETAIL_BUFFER_SIZE):
+            chunk_references = [reference for _, reference in chunk]
+            stored = {}
+            if db is not None and self.raw_store is not None:
+                stored = load_stored(db, "tip", chunk_references)
+            with STAGE_LATENCY.time(stage="details"):
+                details = self.fetch_tip_details(chunk_references, concurrency, stored, tipster, db)
+            for (skip, reference), bet_data in zip(chunk, details):
+                yield skip, reference, bet_data
+    
+    def _iter_records(self, details):
+        """Стадия 4: отбрасывает прогнозы, детали которых не удалось получить -> (skip, TipRecord)"""
+        for skip, reference, record in details:
+            if record is not None:
+                yield skip, record
+    
+    @staticmethod
+    def _parse_tip_date(tip_date):
+        """ISO-дата из API -> datetime (или None)"""
+        if not tip_date:
+            return None
+        try:
+            return datetime.fromisoformat(tip_date.replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError:
+            return None
+    
+    def retry_failed_references(self, username, concurrency=None, export=EXPORT_ENABLED):
+        """Повторно загружает только прогнозы и фикстуры каппера, которые не удалось получить раньше
+        
+        Новые ставки дописываются в датасет; ставки на события с догруженной фикстурой
+        перенормализуются из сохраненных ответов (raw_store.renormalize_tipster)
+        """
+        self.last_error = None
+        if not self.http and not self.create_session():
+            self.last_error = "Ошибка авторизации"
+            return None
+        
+        db = SessionLocal()
+        writer = ExportWriter(username) if export else None
+        try:
+            tipster = get_or_create_tipster(db, username)
+            references = failed_references(db, username)
+            # Список до повтора прогнозов: их загрузка может догрузить и эти фикстуры
+            fixture_references = failed_fixture_references(db, username) if self.raw_store is not None else []
+            logger.info(f"{username}: повторная загрузка {len(references)} прогнозов")
             
-            df.write_excel(
-                workbook=filename,
-                worksheet="bets",
-                autofit=True,
-                has_header=True
-            )
+            new_bets = 0
+            for chunk in _chunked(references, DETAIL_BUFFER_SIZE):
+                records = [record for record in self.fetch_tip_details(chunk, concurrency, tipster=username, db=db) if record]
+                created_at = datetime.utcnow()
+                bulk_insert_fixtures(db, records_to_fixtures(records))
+                new_bets += bulk_insert_bets(db, records_to_rows(records, tipster.id, created_at))
+                if self.raw_store is not None:
+                    self.raw_store.flush(db)
+                db.commit()
+                if writer is not None:
+                    writer.add(records_to_columns(records, tipster.id, created_at))
             
-            logger.info(f"Данные сохранены в Excel: {filename}")
-            return filename
+            if new_bets:
+                read_cache.invalidate(username)
             
+            fixed = self._retry_fixtures(db, username, fixture_references, concurrency)
+            if writer is not None:
+                # Перенормализация перезаписывает партиции каппера - новые ставки должны быть уже в них
+                writer.close()
+            if fixed:
+                renormalize_tipster(username, fixed, export)
+            return {"tipster": username, "retried": len(references), "new_bets": new_bets,
+                    "fixtures_fixed": len(fixed)}
         except Exception as e:
-            logger.error(f"Ошибка при сохранении в Excel: {e}")
-            # Если не получилось в Excel, сохраняем в JSON
-            return self._save_to_json(data, username)
+            logger.error(f"Ошибка при повторной загрузке: {e}")
+            self.last_error = str(e)
+            db.rollback()
+            return None
+        finally:
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception as e:
+                    logger.error(f"Ошибка при экспорте: {e}")
+            db.close()
+    
+    def _retry_fixtures(self, db, username, references, concurrency=None):
+        """Повторно загружает фикстуры, которые не удалось получить раньше -> загруженные references"""
+        if not references:
+            return []
+        logger.info(f"{username}: повторная загрузка {len(references)} фикстур")
+        
+        workers = self.concurrency if concurrency is None else concurrency
+        fetched = ConcurrentFetcher(max_workers=workers).map(
+            lambda reference: fixture_cache.get_or_load(reference, lambda: self._fetch_fixture(reference)), references
+        )
+        fixed = [ref for ref, fixture_data in zip(references, fetched) if fixture_data is not None]
+        self.raw_store.flush(db)
+        db.commit()
+        return fixed
     
-    def _save_to_json(self, data, username):
-        """Резервное сохранение в JSON"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{username}_bets_{timestamp}.json"
+    def _fetch_json(self, url, kind, reference, stored=None, tipster=None):
+        """Ответ API как dict: из сохраненного ответа, по условному GET (304) или из сети
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        Возвращает (payload, status_code); новые ответы и ошибки уходят в raw_store
+        """
+        if stored is not None and stored.status == "ok" and not RAW_REVALIDATE:
+            return stored.payload, 200
+        
+        response = self._get(url, headers=conditional_headers(stored)) if stored is not None else self._get(url)
+        if response.status_code == 304 and stored is not None and stored.status == "ok":
+            return stored.payload, 200
+        
+        if response.status_code != 200:
+            if self.raw_store is not None:
+                self.raw_store.fail(kind, reference, f"HTTP {response.status_code}", response.status_code, tipster)
+            return None, response.status_code
         
-        logger.info(f"Данные сохранены в JSON: {filename}")
-        return filename
+        payload = json_loads(response.content)
+        if self.raw_store is not None:
+            self.raw_store.add(kind, reference, response, tipster, stored.content_hash if stored else None)
+        return payload, 200
+    
+    def _parse_tip_details(self, reference, stored=None, tipster=None, stored_fixtures=None):
+        """Внутренний метод парсинга деталей ставки -> TipRecord (или None)"""
+        return self._build_record(reference, self._fetch_tip(reference, stored, tipster), stored_fixtures or {})
+    
+    def _fetch_fixture(self, fixture_reference, stored=None):
+        """Детали матча -> dict (или None); ошибка попадает в raw_store и догружается выборочным повтором,
+        а прогноз сохраняется без данных фикстуры
+        """
+        try:
+            fixture_url = f"{API_FIXTURE_URL}/{fixture_reference}"
+            fixture_data, _ = self._fetch_json(fixture_url, "fixture", fixture_reference, stored)
+        except RequestBudgetExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при запросе фикстуры {fixture_reference}: {e}")
+            if self.raw_store is not None:
+                self.raw_store.fail("fixture", fixture_reference, e)
+            return None
+        return fixture_data
+    
+    def _fetch_tip(self, reference, stored=None, tipster=None):
+        """Детали прогноза (ставки) -> dict (или None)"""
+        try:
+            tip_url = f"{API_TIP_URL_TEMPLATE.format(username=self.username)}/{reference}"
+            tip_data, status_code = self._fetch_json(tip_url, "tip", reference, stored, tipster)
+            if tip_data is None:
+                logger.error(f"Ошибка при запросе прогноза {reference}: {status_code}")
+            return tip_data
+        except RequestBudgetExceeded:
+            # Бюджет общий для всего запуска - прерываем синхронизацию каппера целиком
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при парсинге деталей {reference}: {e}")
+            if self.raw_store is not None:
+                self.raw_store.fail("tip", reference, e, tipster=tipster)
+            return None
+    
+    def _build_record(self, reference, tip_data, stored_fixtures):
+        """Прогноз + детали матча (фикстура из кэша, сохраненного ответа или сети) -> TipRecord (или None)"""
+        if tip_data is None:
+            return None
+        try:
+            fixture_data = None
+            fixture_reference = tip_fixture_reference(tip_data)
+            
+            if fixture_reference:
+                # Фикстуры общие для многих прогнозов - сначала смотрим в кэш,
+                # одновременные промахи по одной фикстуре загружают ее один раз
+                fixture_data = fixture_cache.get_or_load(
+                    fixture_reference,
+                    lambda: self._fetch_fixture(fixture_reference, stored_fixtures.get(fixture_reference))
+                )
 
+            return TipRecord.from_payload(reference, tip_data, fixture_data)
+            
+        except RequestBudgetExceeded:
+            raise
+        except Exception as e:
+            # Ответ прогноза получен, но не разобран - он уже сохранен для перенормализации
+            logger.error(f"Ошибка при парсинге деталей {reference}: {e}")
+            return None
 
-def parse_single_tipster(username="freguli", max_tips=50):
+def parse_single_tipster(username="freguli", max_tips=50, incremental=False):
     """Функция для быстрого теста"""
     parser = TipstrrParser()
-    return parser.parse_tipster(username, max_tips)
+    return parser.parse_tipster(username, max_tips, incremental=incremental)
 
 
 def main():
@@ -360,10 +527,10 @@ def main():
     
     # Запускаем парсер
     parser = TipstrrParser()
-    result = parser.parse_tipster(parser.username, max_tips)
+    result = parser.parse_tipster(parser.username, max_tips, save_excel=True)
     
     if result:
-        print(f"\n✓ Парсинг завершен!")
+        print("\n✓ Парсинг завершен!")
         print(f"Каппер: {result['tipster']}")
         print(f"Всего ставок: {result['total_bets']}")
         print(f"Новых добавлено: {result['new_bets']}")
@@ -0,0 +1,207 @@
+import base64
+import os
+from datetime import datetime
+from sqlalchemy import and_, func, tuple_
+from models import Tipster, Bet, Fixture, TipsterStats
+
+# КОНФИГУРАЦИЯ
+READ_PAGE_SIZE = int(os.environ.get("READ_PAGE_SIZE", "50"))
+READ_PAGE_MAX = int(os.environ.get("READ_PAGE_MAX", "500"))
+
+BET_FILTERS = ("sport", "league", "market", "result")
+LEADERBOARD_SORTS = ("roi", "yield", "volume", "profit")
+
+
+def encode_cursor(event_date, bet_id):
+    """Курсор следующей страницы: позиция последней отданной ставки в порядке (event_date, id)"""
+    raw = f"{event_date.isoformat()}|{bet_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        event_date, bet_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(event_date), int(bet_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Некорректный cursor")
+
+
+def page_limit(limit):
+    if not limit:
+        return READ_PAGE_SIZE
+    return max(1, min(int(limit), READ_PAGE_MAX))
+
+
+def bet_to_dict(bet, username):
+    return {
+        "id": bet.id,
+        "tipster": username,
+        "reference": bet.reference,
+        "event_date": bet.event_date.isoformat() if bet.event_date else None,
+        "match": bet.match,
+        "home_team": bet.home_team,
+        "away_team": bet.away_team,
+        "sport": bet.sport,
+        "league": bet.league,
+        "market": bet.market,
+        "bet": bet.bet,
+        "odds": bet.odds,
+        "result": bet.result,
+        "profit": bet.profit,
+    }
+
+
+def list_bets(db, tipsters=None, filters=None, since=None, until=None, limit=None, cursor=None):
+    """Ставки от новых к старым с keyset-пагинацией по (event_date, id)
+
+    Следующая страница продолжается строго после курсора, поэтому глубина пагинации
+    не влияет на стоимость запроса (индексы ix_bets_tipster_event_date / ix_bets_event_date).
+    Ставки без event_date в выдачу не попадают.
+
+    Возвращает (список ставок, курсор следующей страницы или None)
+    """
+    limit = page_limit(limit)
+    query = (
+        db.query(Bet, Tipster.username)
+        .join(Tipster, Tipster.id == Bet.tipster_id)
+        .filter(Bet.event_date.isnot(None))
+    )
+
+    if tipsters:
+        query = query.filter(Tipster.username.in_(list(tipsters)))
+    for name, value in (filters or {}).items():
+        if name in BET_FILTERS and value:
+            query = query.filter(getattr(Bet, name) == value)
+    if since:
+        query = query.filter(Bet.event_date >= since)
+    if until:
+        query = query.filter(Bet.event_date < until)
+    if cursor:
+        query = query.filter(tuple_(Bet.event_date, Bet.id) < tuple_(*decode_cursor(cursor)))
+
+    rows = query.order_by(Bet.event_date.desc(), Bet.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_bet = rows[-1][0]
+        next_cursor = encode_cursor(last_bet.event_date, last_bet.id)
+    return [bet_to_dict(bet, username) for bet, username in rows], next_cursor
+
+
+def leaderboard(db, sort="roi", limit=None, min_bets=1):
+    """Рейтинг капперов по готовым агрегатам tipster_stats (без сканирования bets)
+
+    sort: roi - прибыль на поставленные деньги (выигрыши и проигрыши, возвраты не в счет),
+    yield - прибыль на ставку, volume - число ставок, profit - прибыль
+    """
+    from storage import stats_to_dict
+
+    if sort not in LEADERBOARD_SORTS:
+        raise ValueError(f"Неизвестная сортировка: {sort} (доступны {', '.join(LEADERBOARD_SORTS)})")
+
+    order = {
+        "roi": (TipsterStats.profit / func.nullif(TipsterStats.wins + TipsterStats.losses, 0)).desc().nullslast(),
+        "profit": TipsterStats.profit.desc(),
+        "yield": (TipsterStats.profit / TipsterStats.bets).desc(),
+        "volume": TipsterStats.bets.desc(),
+    }[sort]
+
+    rows = (
+        db.query(TipsterStats, Tipster.username)
+        .join(Tipster, Tipster.id == TipsterStats.tipster_id)
+        .filter(TipsterStats.dimension == "all", TipsterStats.bets >= max(1, min_bets or 1))
+        .order_by(order, Tipster.username)
+        .limit(page_limit(limit))
+        .all()
+    )
+
+    result = []
+    for rank, (stats, username) in enumerate(rows, start=1):
+        item = stats_to_dict(stats)
+        del item["dimension"], item["value"]
+        result.append(dict(item, rank=rank, tipster=username))
+    return result
+
+
+def fixture_consensus(db, reference):
+    """Консенсус капперов по событию: кто и на что ставит, по рынкам и исходам
+
+    Учитываются сохраненные прогнозы (синхронизируются только завершенные /tips/completed).
+    Голос - пара (каппер, исход): несколько прогнозов каппера на один исход считаются один раз,
+    и его вес добавляется один раз. Строки берутся по индексу ix_bets_fixture_tipster, вес каппера -
+    его прибыль из tipster_stats (капперы в минусе голосуют с весом 0). Возвращает None, если событие неизвестно.
+    """
+    fixture = db.query(Fixture).filter(Fixture.reference == reference).first()
+    rows = (
+        db.query(Bet.market, Bet.bet, Bet.odds, Tipster.username, TipsterStats.profit)
+        .join(Tipster, Tipster.id == Bet.tipster_id)
+        .outerjoin(TipsterStats, and_(TipsterStats.tipster_id == Bet.tipster_id, TipsterStats.dimension == "all"))
+        .filter(Bet.fixture_reference == reference)
+        .all()
+    )
+    if fixture is None and not rows:
+        return None
+
+    # (рынок, исход, каппер) -> вес и коэффициенты его прогнозов
+    votes = {}
+    market_tips = {}
+    for market, selection, odds, username, tipster_profit in rows:
+        market_tips[market or ""] = market_tips.get(market or "", 0) + 1
+        vote = votes.setdefault((market or "", selection or "", username), {
+            "weight": max(tipster_profit or 0.0, 0.0), "odds": []
+        })
+        if odds is not None:
+            vote["odds"].append(odds)
+
+    markets = {}
+    for (market, selection, username), vote in votes.items():
+        selections = markets.setdefault(market, {})
+        item = selections.setdefault(selection, {
+            "selection": selection, "tipsters": [], "weight": 0.0, "odds_sum": 0.0, "odds_count": 0
+        })
+        item["tipsters"].append(username)
+        item["weight"] += vote["weight"]
+        if vote["odds"]:
+            # Каппер с несколькими прогнозами на исход дает один коэффициент - средний
+            item["odds_sum"] += sum(vote["odds"]) / len(vote["odds"])
+            item["odds_count"] += 1
+
+    result = []
+    for market, selections in markets.items():
+        total = sum(len(item["tipsters"]) for item in selections.values())
+        total_weight = sum(item["weight"] for item in selections.values())
+        items = []
+        for item in selections.values():
+            count = len(item["tipsters"])
+            items.append({
+                "selection": item["selection"],
+                "tipsters": sorted(item["tipsters"]),
+                "count": count,
+                "share": round(count / total * 100, 2),
+                "weighted_share": round(item["weight"] / total_weight * 100, 2) if total_weight else None,
+                "avg_odds": round(item["odds_sum"] / item["odds_count"], 3) if item["odds_count"] else None,
+            })
+        items.sort(key=lambda item: (-item["count"], item["selection"]))
+        result.append({
+            "market": market,
+            "tips": market_tips[market],
+            "tipsters": len({username for item in selections.values() for username in item["tipsters"]}),
+            "selections": items,
+        })
+    result.sort(key=lambda market: (-market["tipsters"], market["market"]))
+
+    return {
+        "fixture": {
+            "reference": reference,
+            "home_team": fixture.home_team if fixture else None,
+            "away_team": fixture.away_team if fixture else None,
+            "sport": fixture.sport if fixture else None,
+            "league": fixture.league if fixture else None,
+            "event_date": fixture.event_date.isoformat() if fixture and fixture.event_date else None,
+        },
+        "tips": len(rows),
+        "tipsters": len({row[3] for row in rows}),
+        "markets": result,
+    }
@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import os
+import threading
+import zlib
+import logging
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from models import RawResponse
+from records import json_loads, tip_fixture_reference
+from metrics import DB_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+RAW_STORE_ENABLED = os.environ.get("RAW_STORE_ENABLED", "1") not in ("0", "false", "no")
+RAW_REVALIDATE = os.environ.get("RAW_REVALIDATE", "0") in ("1", "true", "yes")  # условный GET для сохраненных
+RAW_COMPRESSION_LEVEL = int(os.environ.get("RAW_COMPRESSION_LEVEL", "6"))
+RAW_LOOKUP_CHUNK = int(os.environ.get("RAW_LOOKUP_CHUNK", "1000"))
+
+StoredResponse = namedtuple("StoredResponse", "status payload content_hash etag last_modified")
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _decode(row):
+    payload = json_loads(zlib.decompress(row.content)) if row.content is not None else None
+    return StoredResponse(row.status, payload, row.content_hash, row.etag, row.last_modified)
+
+
+def load_stored(db, kind, references):
+    """Сохраненные ответы по references (один IN-запрос на чанк) -> {reference: StoredResponse}"""
+    references = [ref for ref in dict.fromkeys(references) if ref]
+    stored = {}
+    for chunk in _chunks(references, RAW_LOOKUP_CHUNK):
+        with DB_LATENCY.time(operation="select_raw"):
+            rows = db.query(RawResponse).filter(RawResponse.kind == kind, RawResponse.reference.in_(chunk)).all()
+        for row in rows:
+            stored[row.reference] = _decode(row)
+    return stored
+
+
+def conditional_headers(stored):
+    """If-None-Match / If-Modified-Since по сохраненному ответу"""
+    headers = {}
+    if stored is not None and stored.status == "ok":
+        if stored.etag:
+            headers["If-None-Match"] = stored.etag
+        if stored.last_modified:
+            headers["If-Modified-Since"] = stored.last_modified
+    return headers
+
+
+class RawStore:
+    """Буфер сырых ответов синхронизации
+
+    Потоки загрузки только складывают ответы в память, а запись в raw_responses
+    идет одним upsert в транзакции очередного чанка ставок (flush).
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind, reference, response, tipster=None, known_hash=None):
+        """Успешный ответ; неизмененное тело (тот же хэш) повторно не пишется"""
+        content = response.content
+        digest = content_hash(content)
+        if digest == known_hash:
+            return
+        with self._lock:
+            self._pending[(kind, reference)] = {
+                "kind": kind,
+                "reference": reference,
+                "tipster": tipster,
+                "status": "ok",
+                "status_code": response.status_code,
+                "content": zlib.compress(content, RAW_COMPRESSION_LEVEL),
+                "content_hash": digest,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "error": None,
+                "attempts": 1,
+                "fetched_at": datetime.utcnow(),
+            }
+
+    def fail(self, kind, reference, error, status_code=None, tipster=None):
+        """Неудачная загрузка - reference попадет в выборочный повтор"""
+        with self._lock:
+            self._pending[(kind, reference)] = {
+                "kind": kind,
+                "reference": reference,
+                "tipster": tipster,
+                "status": "failed",
+                "status_code": status_code,
+                "content": None,
+                "content_hash": None,
+                "etag": None,
+                "last_modified": None,
+                "error": str(error)[:500],
+                "attempts": 1,
+                "fetched_at": datetime.utcnow(),
+            }
+
+    def flush(self, db):
+        """Записывает накопленные ответы (без коммита)"""
+        with self._lock:
+            rows = list(self._pending.values())
+            self._pending.clear()
+        if not rows:
+            return 0
+
+        dialect = db.get_bind().dialect.name
+        with DB_LATENCY.time(operation="upsert_raw"):
+            if dialect in ("postgresql", "sqlite"):
+                insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+                for status in ("ok", "failed"):
+                    batch = [row for row in rows if row["status"] == status]
+                    if batch:
+                        db.execute(_upsert(insert, batch, status))
+            else:
+                _merge_rows(db, rows)
+        return len(rows)
+
+
+def _upsert(insert, rows, status):
+    table = RawResponse.__table__.c
+    stmt = insert(RawResponse).values(rows)
+    update = {name: stmt.excluded[name] for name in (
+        "tipster", "status", "status_code", "content", "content_hash", "etag", "last_modified", "error", "fetched_at"
+    )}
+    update["attempts"] = table.attempts + 1
+    # Ошибка не затирает уже сохраненный успешный ответ
+    where = table.status != "ok" if status == "failed" else None
+    return stmt.on_conflict_do_update(index_elements=["kind", "reference"], set_=update, where=where)
+
+
+def _merge_rows(db, rows):
+    # Другие СУБД: построчно через ORM
+    for item in rows:
+        row = db.query(RawResponse).filter(
+            RawResponse.kind == item["kind"], RawResponse.reference == item["reference"]
+        ).first()
+        if row is None:
+            db.add(RawResponse(**item))
+        elif item["status"] == "ok" or row.status != "ok":
+            attempts = (row.attempts or 0) + 1
+            for name, value in item.items():
+                setattr(row, name, value)
+            row.attempts = attempts
+
+
+def failed_references(db, username):
+    """Прогнозы каппера, которые не удалось загрузить и которых нет в bets"""
+    from models import Bet
+
+    rows = (
+        db.query(RawResponse.reference)
+        .outerjoin(Bet, Bet.reference == RawResponse.reference)
+        .filter(RawResponse.kind == "tip", RawResponse.tipster == username,
+                RawResponse.status == "failed", Bet.id.is_(None))
+        .order_by(RawResponse.reference)
+        .all()
+    )
+    return [row[0] for row in rows]
+
+
+def failed_fixture_references(db, username):
+    """Фикстуры ставок каппера, которые не удалось загрузить (ставки сохранены без команд, спорта и лиги)"""
+    from models import Bet, Tipster
+
+    fixture_refs = (
+        db.query(Bet.fixture_reference)
+        .join(Tipster, Tipster.id == Bet.tipster_id)
+        .filter(Tipster.username == username, Bet.fixture_reference.isnot(None))
+    )
+    rows = (
+        db.query(RawResponse.reference)
+        .filter(RawResponse.kind == "fixture", RawResponse.status == "failed",
+                RawResponse.reference.in_(fixture_refs))
+        .order_by(RawResponse.reference)
+        .all()
+    )
+    return [row[0] for row in rows]
+
+
+def stored_records(db, username, batch_size=RAW_LOOKUP_CHUNK, fixture_references=None):
+    """Нормализует сохраненные прогнозы каппера заново (без обращения к сети), пачками TipRecord
+
+    fixture_references - только прогнозы на эти события (ставки из bets с такой fixture_reference)
+    """
+    from models import Bet
+    from records import TipRecord
+
+    query = (
+        db.query(RawResponse)
+        .filter(RawResponse.kind == "tip", RawResponse.tipster == username, RawResponse.status == "ok")
+        .order_by(RawResponse.id)
+    )
+    if fixture_references is not None:
+        query = query.filter(RawResponse.reference.in_(
+            db.query(Bet.reference).filter(Bet.fixture_reference.in_(list(fixture_references)))
+        ))
+    last_id = 0
+    while True:
+        rows = query.filter(RawResponse.id > last_id).limit(batch_size).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        tips = [(row.reference, _decode(row).payload) for row in rows]
+        fixture_refs = [tip_fixture_reference(tip_data) for _, tip_data in tips]
+        fixtures = load_stored(db, "fixture", fixture_refs)
+
+        records = []
+        for (reference, tip_data), fixture_ref in zip(tips, fixture_refs):
+            fixture = fixtures.get(fixture_ref)
+            records.append(TipRecord.from_payload(
+                reference, tip_data, fixture.payload if fixture and fixture.status == "ok" else None
+            ))
+        yield records
+
+
+def renormalize_tipster(username, fixture_references=None, export=None):
+    """Перестраивает ставки каппера из сохраненных ответов после исправления парсера - ноль HTTP-запросов
+
+    Ставки с сохраненным ответом перезаписываются (fixture_references - только ставки на эти события),
+    агрегаты tipster_stats пересчитываются, партиции каппера в датасете export.py перезаписываются.
+    """
+    from database import SessionLocal
+    from models import Bet, Fixture
+    from cache import read_cache
+    from export import rewrite_tipster, EXPORT_ENABLED
+    from records import records_to_rows, records_to_fixtures
+    from storage import get_or_create_tipster, bulk_insert_bets, bulk_insert_fixtures, rebuild_tipster_stats
+
+    db = SessionLocal()
+    try:
+        tipster = get_or_create_tipster(db, username)
+        if fixture_references:
+            # Строки fixtures, записанные без ответа /fixture, заменяются полными
+            db.query(Fixture).filter(Fixture.reference.in_(list(fixture_references))).delete(synchronize_session=False)
+        total = 0
+        for records in stored_records(db, username, fixture_references=fixture_references):
+            references = [record.reference for record in records]
+            db.query(Bet).filter(Bet.reference.in_(references)).delete(synchronize_session=False)
+            bulk_insert_fixtures(db, records_to_fixtures(records))
+            total += bulk_insert_bets(db, records_to_rows(records, tipster.id))
+        rebuild_tipster_stats(db, tipster.id)
+        db.commit()
+        read_cache.invalidate(username)
+        logger.info(f"{username}: перенормализовано {total} ставок из сохраненных ответов")
+        if EXPORT_ENABLED if export is None else export:
+            rewrite_tipster(db, username)
+        return total
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Сохраненные ответы tipstrr")
+    arg_parser.add_argument("command", choices=["failed", "retry", "renormalize"])
+    arg_parser.add_argument("username")
+    args = arg_parser.parse_args()
+
+    if args.command == "renormalize":
+        print(renormalize_tipster(args.username))
+    elif args.command == "retry":
+        from parser import TipstrrParser
+
+        print(TipstrrParser().retry_failed_references(args.username))
+    else:
+        from database import SessionLocal
+
+        session = SessionLocal()
+        try:
+            print("\n".join(failed_references(session, args.username)
+                            + failed_fixture_references(session, args.username)))
+        finally:
+            session.close()
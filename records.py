@@ -0,0 +1,167 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+try:
+    # orjson декодирует в несколько раз быстрее стандартного json
+    import orjson
+
+    def json_loads(content):
+        return orjson.loads(content)
+except ImportError:
+    import json
+
+    def json_loads(content):
+        return json.loads(content)
+
+
+RESULT_MAP = {1: 'Win', 2: 'Loss', 3: 'Void'}
+
+# Поля ставки в порядке колонок датасета (export_schema)
+TIP_FIELDS = (
+    "reference", "event_date", "home_team", "away_team", "match", "sport", "league",
+    "market", "bet", "odds", "result", "profit", "raw_result_code", "fixture_reference",
+)
+
+
+def parse_event_date(tip_date):
+    """ISO-дата прогноза из API -> datetime дня события (или None)"""
+    if not tip_date:
+        return None
+    try:
+        dt = datetime.fromisoformat(tip_date.replace('Z', '+00:00'))
+        return datetime(dt.year, dt.month, dt.day)
+    except ValueError:
+        try:
+            return datetime.strptime(tip_date[:10], '%Y-%m-%d')
+        except ValueError:
+            return None
+
+
+def tip_fixture_reference(tip_data):
+    """fixtureReference прогноза из ответа /tips/cached (или None)"""
+    items = tip_data.get('tipBetItem') or []
+    return (items[0].get('fixtureReference') or None) if items else None
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(slots=True)
+class TipRecord:
+    """Нормализованный прогноз: типизированные значения, без промежуточных строк"""
+
+    reference: str
+    event_date: datetime = None
+    home_team: str = ''
+    away_team: str = ''
+    match: str = ''
+    sport: str = ''
+    league: str = ''
+    market: str = ''
+    bet: str = ''
+    odds: float = None
+    result: str = ''
+    profit: float = 0.0
+    raw_result_code: int = 0
+    fixture_reference: str = None
+
+    @classmethod
+    def from_payload(cls, reference, tip_data, fixture_data=None):
+        """Собирает запись из ответов /tips/cached и /fixture"""
+        title = tip_data.get('title') or ''
+
+        tip_bets = tip_data.get('tipBet') or []
+        bet_items = tip_data.get('tipBetItem') or []
+        bet_item = bet_items[0] if bet_items else {}
+
+        home_team = away_team = sport = league = ''
+        if fixture_data:
+            home_team = (fixture_data.get('homeTeam') or {}).get('name', '')
+            away_team = (fixture_data.get('awayTeam') or {}).get('name', '')
+            sport = (fixture_data.get('sport') or {}).get('name', '')
+            league = (fixture_data.get('competition') or {}).get('name', '')
+
+        # Если нет данных из фикстуры, пробуем извлечь из title
+        if not home_team and ' v ' in title:
+            parts = title.split(' v ')
+            if len(parts) == 2:
+                home_team = parts[0].strip()
+                away_team = parts[1].strip()
+
+        result = tip_data.get('result')
+        profit = _to_float(tip_data.get('profit'))
+
+        return cls(
+            reference=reference,
+            event_date=parse_event_date(tip_data.get('tipDate')),
+            home_team=home_team,
+            away_team=away_team,
+            match=f"{home_team} vs {away_team}" if home_team and away_team else title,
+            sport=sport,
+            league=league,
+            market=bet_item.get('marketText', ''),
+            bet=bet_item.get('betText', ''),
+            odds=_to_float(tip_bets[0].get('odds')) if tip_bets else None,
+            result=RESULT_MAP.get(result, f'Unknown ({result})'),
+            profit=profit if profit is not None else 0.0,
+            raw_result_code=result if isinstance(result, int) else 0,
+            fixture_reference=tip_fixture_reference(tip_data),
+        )
+
+
+def records_to_rows(records, tipster_id, created_at=None):
+    """Пачка записей -> параметры пакетной вставки в bets"""
+    created_at = created_at or datetime.utcnow()
+    return [
+        {
+            "tipster_id": tipster_id,
+            "reference": r.reference,
+            "event_date": r.event_date,
+            "home_team": r.home_team,
+            "away_team": r.away_team,
+            "match": r.match,
+            "sport": r.sport,
+            "league": r.league,
+            "market": r.market,
+            "bet": r.bet,
+            "odds": r.odds,
+            "result": r.result,
+            "profit": r.profit,
+            "raw_result_code": r.raw_result_code,
+            "fixture_reference": r.fixture_reference,
+            "created_at": created_at,
+        }
+        for r in records
+    ]
+
+
+def records_to_fixtures(records):
+    """Пачка записей -> строки таблицы fixtures (по одной на fixtureReference)"""
+    fixtures = {}
+    for r in records:
+        if r.fixture_reference and r.fixture_reference not in fixtures:
+            fixtures[r.fixture_reference] = {
+                "reference": r.fixture_reference,
+                "home_team": r.home_team,
+                "away_team": r.away_team,
+                "sport": r.sport,
+                "league": r.league,
+                "event_date": r.event_date,
+            }
+    return list(fixtures.values())
+
+
+def records_to_columns(records, tipster_id, created_at=None):
+    """Пачка записей -> колонки для polars.DataFrame (схема export_schema)"""
+    created_at = created_at or datetime.utcnow()
+    columns = {"tipster_id": [tipster_id] * len(records)}
+    for name in TIP_FIELDS:
+        columns[name] = [getattr(r, name) for r in records]
+    columns["created_at"] = [created_at] * len(records)
+    return columns
@@ -0,0 +1,148 @@
+import argparse
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import SessionLocal
+from fetcher import RequestBudget, RATE_LIMIT_PER_HOST
+from models import Tipster, SyncState
+from parser import TipstrrParser
+from storage import get_or_create_tipster, get_or_create_sync_state
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+DEFAULT_WORKERS = 4
+
+
+def _record_status(username, **fields):
+    """Записывает статус синхронизации каппера в sync_states"""
+    db = SessionLocal()
+    try:
+        tipster = get_or_create_tipster(db, username)
+        sync_state = get_or_create_sync_state(db, tipster.id)
+        for name, value in fields.items():
+            setattr(sync_state, name, value)
+        db.commit()
+    except Exception as e:
+        logger.error(f"Не удалось сохранить статус {username}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def sync_tipster(username, budget, max_tips=None, incremental=False, concurrency=None, progress_callback=None):
+    """Синхронизирует одного каппера и сохраняет статус, длительность и счетчики"""
+    started_at = datetime.utcnow()
+    started = time.monotonic()
+    _record_status(username, status="running", last_started_at=started_at, last_error=None)
+
+    result = None
+    error = None
+    try:
+        parser = TipstrrParser(rate_limiter=budget)
+        result = parser.parse_tipster(username, max_tips, concurrency=concurrency, incremental=incremental,
+                                      progress_callback=progress_callback)
+        error = parser.last_error
+    except Exception as e:
+        error = str(e)
+
+    duration = round(time.monotonic() - started, 3)
+    status = "done" if result else "failed"
+    _record_status(
+        username,
+        status=status,
+        last_error=None if result else (error or "Неизвестная ошибка"),
+        last_duration=duration,
+        last_total_bets=result["total_bets"] if result else None,
+        last_new_bets=result["new_bets"] if result else None
+    )
+
+    logger.info(f"{username}: {status} за {duration} с")
+    return {
+        "tipster": username,
+        "status": status,
+        "duration": duration,
+        "total_bets": result["total_bets"] if result else 0,
+        "new_bets": result["new_bets"] if result else 0,
+        "error": None if result else error
+    }
+
+
+def sync_tipsters(usernames, workers=DEFAULT_WORKERS, requests_per_second=RATE_LIMIT_PER_HOST,
+                  max_requests=None, max_tips=None, incremental=False, concurrency=None):
+    """Синхронизирует список капперов пулом воркеров с общим бюджетом запросов"""
+    usernames = list(dict.fromkeys(u for u in usernames if u))
+    if not usernames:
+        return []
+
+    budget = RequestBudget(rate=requests_per_second, max_requests=max_requests)
+    logger.info(f"Пакетная синхронизация: {len(usernames)} капперов, {workers} воркеров")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tipstrr-sync") as pool:
+        results = list(pool.map(
+            lambda username: sync_tipster(username, budget, max_tips, incremental, concurrency),
+            usernames
+        ))
+
+    failed = [r["tipster"] for r in results if r["status"] != "done"]
+    logger.info(f"Готово: {len(results) - len(failed)} успешно, {len(failed)} с ошибкой, запросов: {budget.used}")
+    return results
+
+
+def failed_tipsters():
+    """Капперы, последняя синхронизация которых завершилась ошибкой"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Tipster.username)
+            .join(SyncState, SyncState.tipster_id == Tipster.id)
+            .filter(SyncState.status == "failed")
+            .all()
+        )
+        return [row[0] for row in rows]
+    finally:
+        db.close()
+
+
+def retry_failed(**kwargs):
+    """Повторяет синхронизацию только для капперов со статусом failed"""
+    return sync_tipsters(failed_tipsters(), **kwargs)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Пакетная синхронизация капперов Tipstrr")
+    arg_parser.add_argument("usernames", nargs="*", help="Список капперов")
+    arg_parser.add_argument("--file", help="Файл со списком капперов (по одному в строке)")
+    arg_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    arg_parser.add_argument("--rps", type=float, default=RATE_LIMIT_PER_HOST, help="Общий лимит запросов в секунду")
+    arg_parser.add_argument("--max-requests", type=int, help="Общий лимит запросов на весь запуск")
+    arg_parser.add_argument("--max-tips", type=int)
+    arg_parser.add_argument("--incremental", action="store_true")
+    arg_parser.add_argument("--retry-failed", action="store_true", help="Повторить только упавших капперов")
+    args = arg_parser.parse_args()
+
+    usernames = list(args.usernames)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            usernames.extend(line.strip() for line in f if line.strip())
+    if args.retry_failed:
+        usernames.extend(failed_tipsters())
+
+    results = sync_tipsters(
+        usernames,
+        workers=args.workers,
+        requests_per_second=args.rps,
+        max_requests=args.max_requests,
+        max_tips=args.max_tips,
+        incremental=args.incremental
+    )
+
+    for r in results:
+        mark = "✓" if r["status"] == "done" else "✗"
+        print(f"{mark} {r['tipster']}: {r['new_bets']} новых из {r['total_bets']} за {r['duration']} с"
+              + (f" ({r['error']})" if r["error"] else ""))
+
+
+if __name__ == "__main__":
+    main()
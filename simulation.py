@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+SIM_PATHS = int(os.environ.get("SIM_PATHS", "5000"))
+SIM_BATCH_PATHS = int(os.environ.get("SIM_BATCH_PATHS", "1000"))  # путей за один проход (ограничивает память)
+SIM_WORKERS = int(os.environ.get("SIM_WORKERS", "0"))  # 0 - по числу ядер
+SIM_METHOD = os.environ.get("SIM_METHOD", "bootstrap")  # bootstrap или permutation
+STAKE_PERCENT = float(os.environ.get("STAKE_PERCENT", "0.02"))  # доля банкролла на ставку
+KELLY_MULTIPLIER = float(os.environ.get("KELLY_MULTIPLIER", "0.5"))  # дробный Келли
+KELLY_CAP = float(os.environ.get("KELLY_CAP", "0.1"))  # максимум доли банкролла на ставку
+RUIN_LEVEL = float(os.environ.get("RUIN_LEVEL", "0.05"))  # разорение - банкролл ниже этой доли стартового
+
+STAKING_PLANS = ("flat", "percentage", "kelly")
+METHODS = ("bootstrap", "permutation")
+
+
+def load_histories(usernames=None):
+    """История ставок капперов одним запросом -> {username: (odds, returns)}
+
+    returns - прибыль на единицу ставки (profit из bets: выигрыш odds - 1, проигрыш -1, возврат 0)
+    """
+    from analytics import load_bets
+
+    df = (
+        load_bets(usernames)
+        .filter(pl.col("result").is_in(["Win", "Loss", "Void"]))
+        .sort(["tipster", "event_date", "id"], nulls_last=True)
+    )
+    histories = {}
+    for (username,), group in df.group_by(["tipster"], maintain_order=True):
+        histories[username] = (
+            group["odds"].fill_null(1.0).to_numpy().astype(np.float64),
+            group["profit"].fill_null(0.0).to_numpy().astype(np.float64),
+        )
+    return histories
+
+
+def _sample_indices(rng, n_paths, n_bets, method):
+    if method == "permutation":
+        # Та же история в случайном порядке: важна только последовательность
+        return np.argsort(rng.random((n_paths, n_bets)), axis=1)
+    # Бутстрэп: ставки выбираются с возвращением
+    return rng.integers(0, n_bets, size=(n_paths, n_bets))
+
+
+def _stake_fractions(odds, returns, kelly_multiplier, kelly_cap):
+    """Доля банкролла по Келли для каждой ставки
+
+    Перевес оценивается по всей истории каппера (yield): p * odds - 1 = yield,
+    поэтому f = yield / (odds - 1). Оценка in-sample - реальный перевес будет меньше.
+    """
+    edge = returns.mean()
+    fractions = np.where(odds > 1.0, edge / np.maximum(odds - 1.0, 1e-9), 0.0)
+    return np.clip(fractions * kelly_multiplier, 0.0, kelly_cap)
+
+
+def _bankroll_paths(plan, returns, fractions, starting_bankroll, stake_percent):
+    """Банкролл после каждой ставки для пачки путей (n_paths, n_bets)"""
+    if plan == "flat":
+        # Фиксированная ставка 1 единица
+        return starting_bankroll + np.cumsum(returns, axis=1)
+    if plan == "percentage":
+        growth = 1.0 + stake_percent * returns
+    else:
+        growth = 1.0 + fractions * returns
+    return starting_bankroll * np.cumprod(np.maximum(growth, 0.0), axis=1)
+
+
+def _summary(final, drawdowns, ruined, starting_bankroll):
+    roi = (final - starting_bankroll) / starting_bankroll * 100
+    low, median, high = np.percentile(roi, [2.5, 50, 97.5])
+    return {
+        "roi_mean": round(float(roi.mean()), 2),
+        "roi_median": round(float(median), 2),
+        "roi_ci95": [round(float(low), 2), round(float(high), 2)],
+        "profit_probability": round(float((final > starting_bankroll).mean()), 4),
+        "ruin_probability": round(float(ruined.mean()), 4),
+        "final_bankroll_median": round(float(np.median(final)), 2),
+        "max_drawdown_mean": round(float(drawdowns.mean()) * 100, 2),
+        "max_drawdown_percentiles": {
+            f"p{q}": round(float(value) * 100, 2)
+            for q, value in zip((50, 75, 95, 99), np.percentile(drawdowns, [50, 75, 95, 99]))
+        },
+    }
+
+
+def simulate_history(odds, returns, n_paths=SIM_PATHS, method=SIM_METHOD, plans=STAKING_PLANS,
+                     starting_bankroll=None, stake_percent=STAKE_PERCENT, kelly_multiplier=KELLY_MULTIPLIER,
+                     kelly_cap=KELLY_CAP, ruin_level=RUIN_LEVEL, seed=None, batch_paths=SIM_BATCH_PATHS):
+    """Монте-Карло по одной истории ставок для нескольких планов ставок
+
+    Все пути считаются векторно (numpy) пачками по batch_paths, чтобы память не зависела от n_paths.
+    Просадка - доля от максимума банкролла на пути, разорение - банкролл ниже ruin_level стартового.
+    """
+    if starting_bankroll is None:
+        from storage import STARTING_BANKROLL
+        starting_bankroll = STARTING_BANKROLL
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод: {method} (доступны {', '.join(METHODS)})")
+    unknown = [plan for plan in plans if plan not in STAKING_PLANS]
+    if unknown:
+        raise ValueError(f"Неизвестные планы ставок: {', '.join(unknown)}")
+
+    odds = np.asarray(odds, dtype=np.float64)
+    returns = np.asarray(returns, dtype=np.float64)
+    n_bets = len(returns)
+    if n_bets == 0:
+        return {"bets": 0, "paths": 0, "plans": {}}
+
+    rng = np.random.default_rng(seed)
+    kelly_fractions = _stake_fractions(odds, returns, kelly_multiplier, kelly_cap)
+    ruin_bankroll = starting_bankroll * ruin_level
+
+    finals = {plan: [] for plan in plans}
+    drawdowns = {plan: [] for plan in plans}
+    ruined = {plan: [] for plan in plans}
+
+    for start in range(0, n_paths, batch_paths):
+        indices = _sample_indices(rng, min(batch_paths, n_paths - start), n_bets, method)
+        sampled_returns = returns[indices]
+        sampled_fractions = kelly_fractions[indices]
+
+        for plan in plans:
+            bankroll = _bankroll_paths(plan, sampled_returns, sampled_fractions, starting_bankroll, stake_percent)
+            peaks = np.maximum(np.maximum.accumulate(bankroll, axis=1), starting_bankroll)
+            finals[plan].append(bankroll[:, -1])
+            drawdowns[plan].append(np.max(1.0 - np.maximum(bankroll, 0.0) / peaks, axis=1))
+            ruined[plan].append(np.min(bankroll, axis=1) <= ruin_bankroll)
+
+    return {
+        "bets": n_bets,
+        "paths": n_paths,
+        "method": method,
+        "plans": {
+            plan: _summary(np.concatenate(finals[plan]), np.concatenate(drawdowns[plan]),
+                           np.concatenate(ruined[plan]), starting_bankroll)
+            for plan in plans
+        },
+    }
+
+
+def _simulate_one(args):
+    username, odds, returns, seed, options = args
+    result = simulate_history(odds, returns, seed=seed, **options)
+    return dict(result, tipster=username)
+
+
+def simulate_tipsters(usernames=None, n_paths=SIM_PATHS, method=SIM_METHOD, plans=STAKING_PLANS,
+                      workers=SIM_WORKERS, seed=None, **options):
+    """Симуляция для нескольких капперов: данные читаются одним запросом, капперы считаются параллельно
+    в отдельных процессах (по одному на ядро)
+    """
+    histories = load_histories(usernames)
+    if not histories:
+        return []
+
+    # Независимые генераторы для каждого каппера - результат воспроизводим при заданном seed
+    seeds = np.random.SeedSequence(seed).spawn(len(histories))
+    options = dict(options, n_paths=n_paths, method=method, plans=tuple(plans))
+    tasks = [
+        (username, odds, returns, child_seed, options)
+        for (username, (odds, returns)), child_seed in zip(histories.items(), seeds)
+    ]
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        return [_simulate_one(task) for task in tasks]
+
+    logger.info(f"Симуляция {len(tasks)} капперов на {workers} процессах")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_simulate_one, tasks))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Монте-Карло планов ставок по истории капперов")
+    arg_parser.add_argument("tipsters", nargs="*", help="username капперов (по умолчанию все)")
+    arg_parser.add_argument("--paths", type=int, default=SIM_PATHS)
+    arg_parser.add_argument("--method", choices=METHODS, default=SIM_METHOD)
+    arg_parser.add_argument("--plans", nargs="+", choices=STAKING_PLANS, default=list(STAKING_PLANS))
+    arg_parser.add_argument("--workers", type=int, default=SIM_WORKERS)
+    arg_parser.add_argument("--seed", type=int)
+    arg_parser.add_argument("--output", help="Файл JSON (по умолчанию stdout)")
+    args = arg_parser.parse_args()
+
+    results = simulate_tipsters(args.tipsters or None, args.paths, args.method, args.plans, args.workers, args.seed)
+    report = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
@@ -0,0 +1,342 @@
+import os
+import logging
+from datetime import datetime
+from sqlalchemy import insert, case
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Tipster, Bet, Fixture, SyncState, TipsterStats
+from metrics import DB_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+BULK_INSERT_CHUNK = int(os.environ.get("BULK_INSERT_CHUNK", "500"))
+REFERENCE_LOOKUP_CHUNK = int(os.environ.get("REFERENCE_LOOKUP_CHUNK", "1000"))
+STATS_REBUILD_BATCH = int(os.environ.get("STATS_REBUILD_BATCH", "5000"))
+STARTING_BANKROLL = float(os.environ.get("STARTING_BANKROLL", "100"))  # в единицах ставки (analytics, simulation)
+
+STATS_DIMENSIONS = ("sport", "league", "month")
+_STATS_COUNTERS = ("bets", "wins", "losses", "voids", "profit", "odds_sum", "odds_count")
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_or_create_tipster(db, username):
+    """Находит каппера по username или создает новую запись"""
+    with DB_LATENCY.time(operation="select_tipster"):
+        tipster = db.query(Tipster).filter(Tipster.username == username).first()
+    if not tipster:
+        tipster = Tipster(
+            username=username,
+            name=username,
+            profile_url=f"https://tipstrr.com/tipster/{username}"
+        )
+        db.add(tipster)
+        db.commit()
+        db.refresh(tipster)
+    return tipster
+
+
+def get_or_create_sync_state(db, tipster_id):
+    """Состояние синхронизации каппера (создается без коммита)"""
+    sync_state = db.query(SyncState).filter(SyncState.tipster_id == tipster_id).first()
+    if not sync_state:
+        sync_state = SyncState(tipster_id=tipster_id)
+        db.add(sync_state)
+    return sync_state
+
+
+def existing_references(db, references, chunk_size=REFERENCE_LOOKUP_CHUNK):
+    """Возвращает множество references, которые уже есть в таблице bets (один IN-запрос на чанк)"""
+    references = [ref for ref in dict.fromkeys(references) if ref]
+    known = set()
+    for chunk in _chunks(references, chunk_size):
+        with DB_LATENCY.time(operation="select_references"):
+            rows = db.query(Bet.reference).filter(Bet.reference.in_(chunk)).all()
+        known.update(row[0] for row in rows)
+    return known
+
+
+def _dialect_insert(db, model):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return None
+
+
+def _insert_ignore_duplicates(db):
+    """INSERT ... ON CONFLICT (reference) DO NOTHING для PostgreSQL и SQLite"""
+    stmt = _dialect_insert(db, Bet)
+    return stmt.on_conflict_do_nothing(index_elements=["reference"]) if stmt is not None else None
+
+
+def bulk_insert_bets(db, rows, chunk_size=BULK_INSERT_CHUNK):
+    """Пакетная вставка ставок; дубликаты по reference пропускаются. Возвращает число вставленных строк
+
+    В той же транзакции обновляются агрегаты tipster_stats по фактически вставленным строкам.
+    """
+    if not rows:
+        return 0
+
+    # Повторы reference внутри пачки: вставится только первый, и агрегаты должны учесть его один раз
+    unique = {}
+    for row in rows:
+        unique.setdefault(row["reference"], row)
+    rows = list(unique.values())
+
+    stmt = _insert_ignore_duplicates(db)
+    inserted = 0
+    for chunk in _chunks(rows, chunk_size):
+        if stmt is None:
+            # Другие СУБД: обычная пакетная вставка без ON CONFLICT
+            with DB_LATENCY.time(operation="insert_bets"):
+                db.execute(insert(Bet), chunk)
+            inserted += len(chunk)
+            update_tipster_stats(db, chunk)
+            continue
+
+        # Один многострочный INSERT на чанк - точный rowcount и один round-trip
+        with DB_LATENCY.time(operation="insert_bets"):
+            result = db.execute(stmt.values(chunk))
+        count = result.rowcount if result.rowcount >= 0 else len(chunk)
+        inserted += count
+        if count == len(chunk):
+            update_tipster_stats(db, chunk)
+        elif count:
+            update_tipster_stats(db, _inserted_rows(db, chunk))
+
+    return inserted
+
+
+def bulk_insert_fixtures(db, rows):
+    """Пакетная вставка событий; уже известные fixtures пропускаются. Возвращает число новых строк"""
+    if not rows:
+        return 0
+
+    stmt = _dialect_insert(db, Fixture)
+    if stmt is None:
+        known = {row[0] for row in
+                 db.query(Fixture.reference).filter(Fixture.reference.in_([row["reference"] for row in rows]))}
+        rows = [row for row in rows if row["reference"] not in known]
+        if rows:
+            db.execute(insert(Fixture), rows)
+        return len(rows)
+
+    with DB_LATENCY.time(operation="insert_fixtures"):
+        result = db.execute(stmt.values(rows).on_conflict_do_nothing(index_elements=["reference"]))
+    return result.rowcount if result.rowcount >= 0 else len(rows)
+
+
+def _inserted_rows(db, chunk):
+    """Строки чанка, которые действительно вставлены (у пропущенных дубликатов другой created_at)"""
+    stored = dict(
+        db.query(Bet.reference, Bet.created_at)
+        .filter(Bet.reference.in_([row["reference"] for row in chunk]))
+        .all()
+    )
+    return [row for row in chunk if stored.get(row["reference"]) == row.get("created_at")]
+
+
+def _stats_keys(row):
+    event_date = row["event_date"]
+    yield "all", ""
+    yield "sport", row["sport"] or ""
+    yield "league", row["league"] or ""
+    yield "month", event_date.strftime("%Y-%m") if event_date else "unknown"
+
+
+def _aggregate_stats(rows, acc=None):
+    """Свертка строк ставок в приращения {(tipster_id, dimension, value): агрегаты}"""
+    acc = {} if acc is None else acc
+    for row in rows:
+        result = row["result"]
+        odds = row["odds"]
+        event_date = row["event_date"]
+        for dimension, value in _stats_keys(row):
+            key = (row["tipster_id"], dimension, value)
+            stats = acc.get(key)
+            if stats is None:
+                stats = acc[key] = {
+                    "bets": 0, "wins": 0, "losses": 0, "voids": 0, "profit": 0.0,
+                    "odds_sum": 0.0, "odds_count": 0, "first_bet": None, "last_bet": None,
+                }
+            stats["bets"] += 1
+            stats["wins"] += result == "Win"
+            stats["losses"] += result == "Loss"
+            stats["voids"] += result == "Void"
+            stats["profit"] += row["profit"] or 0.0
+            if odds is not None:
+                stats["odds_sum"] += odds
+                stats["odds_count"] += 1
+            if event_date is not None:
+                if stats["first_bet"] is None or event_date < stats["first_bet"]:
+                    stats["first_bet"] = event_date
+                if stats["last_bet"] is None or event_date > stats["last_bet"]:
+                    stats["last_bet"] = event_date
+    return acc
+
+
+def _stats_params(acc):
+    now = datetime.utcnow()
+    return [
+        dict(stats, tipster_id=tipster_id, dimension=dimension, dimension_value=value, updated_at=now)
+        for (tipster_id, dimension, value), stats in acc.items()
+    ]
+
+
+def _earliest(current, new):
+    return case((current.is_(None), new), (new.is_(None), current), (new < current, new), else_=current)
+
+
+def _latest(current, new):
+    return case((current.is_(None), new), (new.is_(None), current), (new > current, new), else_=current)
+
+
+def update_tipster_stats(db, rows):
+    """Прибавляет вставленные ставки к tipster_stats (один upsert на чанк, без коммита)"""
+    if not rows:
+        return
+
+    params = _stats_params(_aggregate_stats(rows))
+    stmt = _dialect_insert(db, TipsterStats)
+    with DB_LATENCY.time(operation="update_stats"):
+        if stmt is None:
+            _update_tipster_stats_orm(db, params)
+            return
+
+        table = TipsterStats.__table__.c
+        stmt = stmt.values(params)
+        update = {name: table[name] + stmt.excluded[name] for name in _STATS_COUNTERS}
+        update.update(
+            first_bet=_earliest(table.first_bet, stmt.excluded.first_bet),
+            last_bet=_latest(table.last_bet, stmt.excluded.last_bet),
+            updated_at=stmt.excluded.updated_at,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["tipster_id", "dimension", "dimension_value"], set_=update
+        ))
+
+
+def _update_tipster_stats_orm(db, params):
+    # Другие СУБД: чтение и обновление строк агрегатов через ORM
+    for item in params:
+        stats = db.query(TipsterStats).filter(
+            TipsterStats.tipster_id == item["tipster_id"],
+            TipsterStats.dimension == item["dimension"],
+            TipsterStats.dimension_value == item["dimension_value"],
+        ).with_for_update().first()
+        if stats is None:
+            db.add(TipsterStats(**item))
+            continue
+        for name in _STATS_COUNTERS:
+            setattr(stats, name, (getattr(stats, name) or 0) + item[name])
+        if item["first_bet"] and (stats.first_bet is None or item["first_bet"] < stats.first_bet):
+            stats.first_bet = item["first_bet"]
+        if item["last_bet"] and (stats.last_bet is None or item["last_bet"] > stats.last_bet):
+            stats.last_bet = item["last_bet"]
+        stats.updated_at = item["updated_at"]
+
+
+def rebuild_tipster_stats(db, tipster_id, batch_size=STATS_REBUILD_BATCH):
+    """Пересчитывает агрегаты каппера по всей истории bets (для данных, записанных до tipster_stats)"""
+    query = (
+        db.query(Bet.tipster_id, Bet.event_date, Bet.sport, Bet.league, Bet.odds, Bet.result, Bet.profit)
+        .filter(Bet.tipster_id == tipster_id)
+        .yield_per(batch_size)
+    )
+    acc = {}
+    with DB_LATENCY.time(operation="rebuild_stats"):
+        for row in query:
+            _aggregate_stats([row._asdict()], acc)
+
+        db.query(TipsterStats).filter(TipsterStats.tipster_id == tipster_id).delete(synchronize_session=False)
+        params = _stats_params(acc)
+        for chunk in _chunks(params, BULK_INSERT_CHUNK):
+            db.execute(insert(TipsterStats), chunk)
+    return len(params)
+
+
+def ensure_tipster_stats(db, tipster_id):
+    """Заполняет tipster_stats, если у каппера есть ставки, а агрегатов еще нет (без коммита)"""
+    has_stats = db.query(TipsterStats.id).filter(
+        TipsterStats.tipster_id == tipster_id, TipsterStats.dimension == "all"
+    ).first()
+    if has_stats:
+        return False
+
+    has_bets = db.query(Bet.id).filter(Bet.tipster_id == tipster_id).first()
+    if not has_bets:
+        return False
+
+    logger.info(f"Пересчитываю агрегаты каппера {tipster_id} по существующей истории")
+    rebuild_tipster_stats(db, tipster_id)
+    return True
+
+
+def backfill_tipster_stats(db):
+    """ensure_tipster_stats для всех капперов, у которых есть ставки, но нет агрегатов (с коммитом)"""
+    missing = (
+        db.query(Tipster.id)
+        .filter(Tipster.bets.any())
+        .filter(~db.query(TipsterStats.id).filter(
+            TipsterStats.tipster_id == Tipster.id, TipsterStats.dimension == "all"
+        ).exists())
+        .all()
+    )
+    for (tipster_id,) in missing:
+        rebuild_tipster_stats(db, tipster_id)
+        db.commit()
+    return len(missing)
+
+
+def stats_to_dict(stats):
+    """Агрегаты -> dict для JSON; ставка = 1 единица, ROI - прибыль на поставленные деньги (возвраты не в счет)"""
+    settled = (stats.wins or 0) + (stats.losses or 0)
+    return {
+        "dimension": stats.dimension,
+        "value": stats.dimension_value,
+        "bets": stats.bets,
+        "wins": stats.wins,
+        "losses": stats.losses,
+        "voids": stats.voids,
+        "profit": round(stats.profit or 0.0, 2),
+        "yield": round((stats.profit or 0.0) / stats.bets * 100, 2) if stats.bets else None,
+        "roi": round((stats.profit or 0.0) / settled * 100, 2) if settled else None,
+        "strike_rate": round(stats.wins / settled * 100, 2) if settled else None,
+        "avg_odds": round(stats.odds_sum / stats.odds_count, 3) if stats.odds_count else None,
+        "first_bet": stats.first_bet.isoformat() if stats.first_bet else None,
+        "last_bet": stats.last_bet.isoformat() if stats.last_bet else None,
+    }
+
+
+def get_tipster_stats(db, username, by=None):
+    """Готовые агрегаты каппера из tipster_stats (чтение по индексу, без сканирования bets)
+
+    by - список разрезов из STATS_DIMENSIONS. Возвращает None, если каппера нет.
+    """
+    tipster = db.query(Tipster).filter(Tipster.username == username).first()
+    if not tipster:
+        return None
+
+    dimensions = ["all"] + [dim for dim in (by or []) if dim in STATS_DIMENSIONS]
+    rows = (
+        db.query(TipsterStats)
+        .filter(TipsterStats.tipster_id == tipster.id, TipsterStats.dimension.in_(dimensions))
+        .order_by(TipsterStats.dimension, TipsterStats.dimension_value)
+        .all()
+    )
+
+    result = {"tipster": tipster.username, "total": None}
+    for dim in dimensions[1:]:
+        result[dim] = []
+    for stats in rows:
+        item = stats_to_dict(stats)
+        if stats.dimension == "all":
+            result["total"] = item
+        else:
+            result[stats.dimension].append(item)
+    return result
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+import polars as pl
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from export import ExportWriter, export_schema, scan_history, rewrite_tipster, _partition_files
+from models import Base, Tipster, Bet
+from records import TipRecord, records_to_columns
+
+
+def _export(base_dir, username, months):
+    writer = ExportWriter(username, base_dir=str(base_dir))
+    records = [
+        TipRecord(reference=f"{username}-{month}", event_date=datetime(2024, month, 5), fixture_reference=f"fx-{month}")
+        for month in months
+    ]
+    writer.add(records_to_columns(records, 1))
+    writer.close()
+
+
+def test_filters_prune_partitions_before_scan(tmp_path):
+    for username in ("alice", "bob", "123"):
+        _export(tmp_path, username, (4, 5, 6))
+
+    files = _partition_files(str(tmp_path), "parquet", ["alice", "123"], datetime(2024, 5, 1), datetime(2024, 6, 1))
+    assert sorted((tipster, month) for tipster, month, _ in files) == [("123", "2024-05"), ("alice", "2024-05")]
+
+    df = scan_history(["alice", "123"], datetime(2024, 5, 1), datetime(2024, 6, 1), base_dir=str(tmp_path)).collect()
+    assert sorted(df["reference"].to_list()) == ["123-5", "alice-5"]
+    assert df.schema["tipster"] == pl.Utf8
+    assert sorted(df["fixture_reference"].to_list()) == ["fx-5", "fx-5"]
+
+
+def test_files_without_new_columns_are_read(tmp_path):
+    _export(tmp_path, "alice", (5,))
+    old_schema = {name: dtype for name, dtype in export_schema().items() if name != "fixture_reference"}
+    old = pl.DataFrame({"reference": ["alice-old"], "event_date": [datetime(2024, 5, 9)]}).with_columns(
+        [pl.lit(None, dtype).alias(name) for name, dtype in old_schema.items() if name not in ("reference", "event_date")]
+    ).select(list(old_schema))
+    old.write_parquet(os.path.join(tmp_path, "tipster=alice", "month=2024-05", "old.parquet"))
+
+    df = scan_history(["alice"], base_dir=str(tmp_path)).sort("reference").collect()
+    assert df["reference"].to_list() == ["alice-5", "alice-old"]
+    assert df["fixture_reference"].to_list() == ["fx-5", None]
+
+
+def test_rewrite_tipster_replaces_stale_partitions(tmp_path):
+    base_dir = str(tmp_path / "ds")
+    _export(base_dir, "alice", (4, 5))
+    _export(base_dir, "bob", (5,))
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'export.db'}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    alice = Tipster(username="alice")
+    db.add(alice)
+    db.flush()
+    db.add(Bet(tipster_id=alice.id, reference="alice-5", event_date=datetime(2024, 5, 5), sport="Tennis",
+               fixture_reference="fx-5", created_at=datetime(2024, 5, 6)))
+    db.commit()
+
+    assert rewrite_tipster(db, "alice", base_dir=base_dir) == 1
+    df = scan_history(base_dir=base_dir).sort("reference").collect()
+    assert df["reference"].to_list() == ["alice-5", "bob-5"]
+    assert df["sport"].to_list() == ["Tennis", ""]
+    db.close()
+    engine.dispose()
@@ -0,0 +1,33 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import FixtureCache
+
+
+def test_concurrent_misses_load_fixture_once(tmp_path):
+    cache = FixtureCache(path=str(tmp_path / "fixtures.sqlite"))
+    calls = []
+    lock = threading.Lock()
+
+    def loader():
+        with lock:
+            calls.append(1)
+        time.sleep(0.05)
+        return {"reference": "fx-1"}
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda _: cache.get_or_load("fx-1", loader), range(32)))
+
+    assert len(calls) == 1
+    assert all(result == {"reference": "fx-1"} for result in results)
+    assert cache.misses == 1 and cache.hits == 31
+
+    # Фикстура попала на диск и читается новым кэшем без загрузки
+    assert FixtureCache(path=str(tmp_path / "fixtures.sqlite")).get("fx-1") == {"reference": "fx-1"}
+
+
+def test_failed_load_is_not_cached():
+    cache = FixtureCache()
+    assert cache.get_or_load("fx-1", lambda: None) is None
+    assert cache.get_or_load("fx-1", lambda: {"reference": "fx-1"}) == {"reference": "fx-1"}
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Tipster, Bet, TipsterStats
+from queries import fixture_consensus
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'consensus.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _tipster(db, username, profit):
+    tipster = Tipster(username=username)
+    db.add(tipster)
+    db.flush()
+    db.add(TipsterStats(tipster_id=tipster.id, dimension="all", dimension_value="", bets=1, profit=profit))
+    return tipster
+
+
+def _bet(db, tipster, reference, selection, odds):
+    db.add(Bet(tipster_id=tipster.id, reference=reference, fixture_reference="fx-1", market="Match Result",
+               bet=selection, odds=odds, event_date=datetime(2024, 6, 1), result="Win", profit=1.0))
+
+
+def test_repeated_tips_of_one_tipster_count_once(db):
+    alice = _tipster(db, "alice", 10.0)
+    bob = _tipster(db, "bob", 10.0)
+    _bet(db, alice, "a-1", "Home", 2.0)
+    _bet(db, alice, "a-2", "Home", 2.2)
+    _bet(db, bob, "b-1", "Away", 3.0)
+    db.commit()
+
+    consensus = fixture_consensus(db, "fx-1")
+    market = consensus["markets"][0]
+    away, home = market["selections"]
+
+    assert consensus["tips"] == 3 and consensus["tipsters"] == 2
+    assert market["tips"] == 3 and market["tipsters"] == 2
+    assert home["tipsters"] == ["alice"] and home["count"] == 1
+    assert home["share"] == away["share"] == 50.0
+    # Вес alice добавлен один раз, а не за каждый прогноз
+    assert home["weighted_share"] == away["weighted_share"] == 50.0
+    assert home["avg_odds"] == 2.1
@@ -0,0 +1,79 @@
+import requests
+
+import http_client
+from http_client import SessionManager
+
+
+class ScriptedSession(requests.Session):
+    """Сессия без сети: GET к API отдает статусы из списка, логин всегда успешен"""
+
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.api_calls = 0
+        self.logins = 0
+
+    def _response(self, status, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers or {})
+        response._content = b"{}"
+        return response
+
+    def get(self, url, **kwargs):
+        if url == http_client.SITE_URL:
+            return self._response(200)
+        self.api_calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        return self._response(*status) if isinstance(status, tuple) else self._response(status)
+
+    def post(self, url, **kwargs):
+        self.logins += 1
+        return self._response(200)
+
+
+def _manager(statuses):
+    session = ScriptedSession(statuses)
+    manager = SessionManager("user", "secret", session=session)
+    manager.max_retries = 0
+    manager.login()
+    session.logins = 0
+    return manager, session
+
+
+def test_forbidden_is_returned_without_relogin():
+    manager, session = _manager([403])
+    assert manager.get("http://api/tip").status_code == 403
+    assert session.logins == 0 and session.api_calls == 1
+
+
+def test_relogin_once_then_return_same_status():
+    manager, session = _manager([401, 401, 401])
+    assert manager.get("http://api/tip").status_code == 401
+    assert session.logins == 1 and session.api_calls == 2
+
+
+def test_relogins_limited_per_window(monkeypatch):
+    monkeypatch.setattr(http_client, "RELOGIN_LIMIT", 2)
+    manager, session = _manager([401] * 10)
+    for _ in range(4):
+        assert manager.get("http://api/tip").status_code == 401
+    assert session.logins == 2
+
+
+def test_retry_after_waits_full_time_up_to_cap(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    manager, session = _manager([(429, {"Retry-After": "20"})])
+    manager.max_retries = 3
+    assert manager.get("http://api/tip").status_code == 200
+    assert sleeps == [20.0] and manager.retries == 1
+
+
+def test_retry_after_longer_than_cap_is_not_retried(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    manager, session = _manager([(429, {"Retry-After": "120"})])
+    manager.max_retries = 3
+    assert manager.get("http://api/tip").status_code == 429
+    assert sleeps == [] and session.api_calls == 1
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_read_routes_do_not_load_polars(tmp_path):
+    # Отдельный интерпретатор: в процессе pytest polars уже мог загрузить другой тест
+    script = """
+import sys
+from database import init_db
+init_db()
+from app import app
+client = app.test_client()
+for url in ("/stats/alice", "/leaderboard", "/leaderboard?sort=roi", "/fixtures/fx-1/consensus", "/bets"):
+    assert client.get(url).status_code in (200, 404), url
+assert "polars" not in sys.modules
+"""
+    env = {"DATABASE_URL": f"sqlite:///{tmp_path / 'lazy.db'}", "PATH": ""}
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Tipster, TipsterStats
+from queries import leaderboard
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leaderboard.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    for username, bets, wins, losses, voids, profit in (
+        ("alice", 10, 6, 4, 0, 5.0),
+        ("bob", 3, 1, 1, 1, 3.0),
+        ("carol", 2, 0, 0, 2, 0.0),
+    ):
+        tipster = Tipster(username=username)
+        session.add(tipster)
+        session.flush()
+        session.add(TipsterStats(tipster_id=tipster.id, dimension="all", dimension_value="", bets=bets, wins=wins,
+                                 losses=losses, voids=voids, profit=profit))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_roi_is_profit_per_unit_staked(db):
+    rows = leaderboard(db, sort="roi")
+    # Возвраты не считаются поставленными деньгами; капперы без рассчитанных ставок в конце
+    assert [(row["tipster"], row["roi"]) for row in rows] == [("bob", 150.0), ("alice", 50.0), ("carol", None)]
+
+
+def test_roi_and_profit_rankings_differ(db):
+    assert [row["tipster"] for row in leaderboard(db, sort="profit")] == ["alice", "bob", "carol"]
+    assert [row["tipster"] for row in leaderboard(db)] == ["bob", "alice", "carol"]
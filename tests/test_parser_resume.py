@@ -0,0 +1,82 @@
+import pytest
+
+import database
+import http_client
+import parser as tipstrr_parser
+from fake_server import create_app, serve_in_thread
+from fetcher import RateLimiter
+from models import Base, Bet, SyncState
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Имитация tipstrr.com, у которой можно сломать страницу списка, и чистая SQLite-БД"""
+    broken = {"skip": None}
+    inner = create_app(tips=95, page_size=10, fixtures=20)
+
+    def flaky(environ, start_response):
+        if "/tips/completed" in environ.get("PATH_INFO", "") and environ.get("QUERY_STRING") == f"skip={broken['skip']}":
+            start_response("503 Service Unavailable", [("Content-Type", "application/json")])
+            return [b"{}"]
+        return inner(environ, start_response)
+
+    server, base_url = serve_in_thread(flaky)
+    api_url = base_url + "/api"
+    monkeypatch.setattr(http_client, "SITE_URL", base_url)
+    monkeypatch.setattr(http_client, "LOGIN_URL", base_url + "/login")
+    monkeypatch.setattr(tipstrr_parser, "API_LIST_URL_TEMPLATE", api_url + "/portfolio/{username}/tips/completed")
+    monkeypatch.setattr(tipstrr_parser, "API_TIP_URL_TEMPLATE", api_url + "/portfolio/{username}/tips/cached")
+    monkeypatch.setattr(tipstrr_parser, "API_FIXTURE_URL", api_url + "/fixture")
+    monkeypatch.setattr(tipstrr_parser, "LIST_PAGE_SIZE", 10)
+    monkeypatch.setattr(tipstrr_parser, "COMMIT_CHUNK_SIZE", 10)
+    monkeypatch.setenv("TIPSTRR_USERNAME", f"resume-{tmp_path.name}")
+    monkeypatch.setenv("TIPSTRR_PASSWORD", "secret")
+
+    monkeypatch.setattr(database, "DATABASE_URL", f"sqlite:///{tmp_path / 'resume.db'}")
+    monkeypatch.setattr(database, "_engine", None)
+    Base.metadata.create_all(database.get_engine())
+    monkeypatch.setattr(http_client, "HTTP_MAX_RETRIES", 0)
+
+    yield broken
+    server.shutdown()
+    database.get_engine().dispose()
+
+
+def _parser():
+    parser = tipstrr_parser.TipstrrParser(concurrency=4, rate_limiter=RateLimiter(rate=0))
+    assert parser.create_session()
+    parser.http.max_retries = 0
+    return parser
+
+
+def test_resume_after_failed_list_page_keeps_high_water_mark(api):
+    api["skip"] = 50
+    parser = _parser()
+    assert parser.parse_tipster("alice", export=False) is None
+
+    db = database.SessionLocal()
+    state = db.query(SyncState).one()
+    assert state.checkpoint_skip == 40 and state.last_reference is None
+    assert db.query(Bet).count() == 50
+    db.close()
+
+    api["skip"] = None
+    result = parser.parse_tipster("alice", export=False)
+    assert result == {"tipster": "alice", "total_bets": 95, "new_bets": 45}
+
+    db = database.SessionLocal()
+    state = db.query(SyncState).one()
+    assert state.last_reference == "alice-0000000" and state.last_tip_date is not None
+    assert state.checkpoint_skip is None
+    assert db.query(Bet).count() == 95
+    db.close()
+
+
+def test_shifted_list_repeats_are_yielded_once(api):
+    pages = [(0, [{"reference": "a"}, {"reference": "b"}]), (10, [{"reference": "b"}, {"reference": "c"}]),
+             (20, [{"reference": "c"}, {"reference": "d"}]), (30, [{"reference": "d"}, {"reference": "e"}])]
+    parser = tipstrr_parser.TipstrrParser()
+    db = database.SessionLocal()
+    references = [ref for _, ref in parser._iter_new_references(db, iter(pages), SyncState())]
+    db.close()
+    assert references == ["a", "b", "c", "d", "e"]
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Bet, TipsterStats
+from storage import bulk_insert_bets, get_or_create_tipster
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+# Как в records_to_rows: одна метка created_at на всю пачку
+CREATED_AT = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def _row(tipster_id, reference, day=0, result="Win", profit=1.0, sport="Football", created_at=CREATED_AT):
+    return {
+        "tipster_id": tipster_id,
+        "reference": reference,
+        "event_date": datetime(2024, 1, 1) + timedelta(days=day),
+        "home_team": "A", "away_team": "B", "match": "A vs B",
+        "sport": sport, "league": "L", "market": "1X2", "bet": "A",
+        "odds": 2.0, "result": result, "profit": profit, "raw_result_code": 1,
+        "created_at": created_at,
+    }
+
+
+def _assert_stats_match_bets(db, tipster_id):
+    bets, profit = db.query(func.count(Bet.id), func.sum(Bet.profit)).filter(Bet.tipster_id == tipster_id).one()
+    total = db.query(TipsterStats).filter(
+        TipsterStats.tipster_id == tipster_id, TipsterStats.dimension == "all"
+    ).one()
+    assert total.bets == bets
+    assert total.profit == pytest.approx(profit)
+
+    for sport, sport_bets in (
+        db.query(Bet.sport, func.count(Bet.id)).filter(Bet.tipster_id == tipster_id).group_by(Bet.sport)
+    ):
+        stats = db.query(TipsterStats).filter(
+            TipsterStats.tipster_id == tipster_id,
+            TipsterStats.dimension == "sport",
+            TipsterStats.dimension_value == sport,
+        ).one()
+        assert stats.bets == sport_bets
+
+
+def test_duplicate_references_in_one_chunk_counted_once(db):
+    tipster = get_or_create_tipster(db, "alice")
+    rows = [_row(tipster.id, "a"), _row(tipster.id, "b", day=1, result="Loss", profit=-1.0), _row(tipster.id, "a")]
+
+    assert bulk_insert_bets(db, rows) == 2
+    db.commit()
+    _assert_stats_match_bets(db, tipster.id)
+
+
+def test_partial_conflict_counts_only_inserted_rows(db):
+    tipster = get_or_create_tipster(db, "alice")
+    earlier = CREATED_AT - timedelta(hours=1)
+    bulk_insert_bets(db, [_row(tipster.id, "a", created_at=earlier), _row(tipster.id, "b", day=1, created_at=earlier)])
+    db.commit()
+
+    rows = [
+        _row(tipster.id, "b", day=1),
+        _row(tipster.id, "c", day=2, result="Loss", profit=-1.0, sport="Tennis"),
+        _row(tipster.id, "c", day=2, result="Loss", profit=-1.0, sport="Tennis"),
+        _row(tipster.id, "d", day=3),
+    ]
+    assert bulk_insert_bets(db, rows, chunk_size=2) == 2
+    db.commit()
+    _assert_stats_match_bets(db, tipster.id)
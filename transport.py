@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+import logging
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# КОНФИГУРАЦИЯ
+TRANSPORT_MODE = os.environ.get("TIPSTRR_TRANSPORT", "live")  # live / record / replay
+ARCHIVE_PATH = os.environ.get("TIPSTRR_ARCHIVE", "tipstrr_archive.db")
+
+
+def request_key(method, url, params=None):
+    """Канонический ключ запроса: метод + путь с отсортированными параметрами
+
+    Хост в ключ не входит, поэтому архив можно воспроизводить с любым базовым URL.
+    """
+    if params:
+        params = sorted(params.items()) if isinstance(params, dict) else sorted(params)
+    prepared = requests.Request(method.upper(), url, params=params).prepare()
+    return f"{method.upper()} {prepared.path_url}"
+
+
+class ArchivedResponse:
+    """Ответ из архива с тем же интерфейсом, что и requests.Response (в нужном нам объеме)"""
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseArchive:
+    """Компактный архив ответов на диске: SQLite, тела сжаты zlib"""
+
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, status INTEGER NOT NULL, headers TEXT NOT NULL, body BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def put(self, key, status_code, headers, content):
+        headers = {name: value for name, value in headers.items()
+                   if name.lower() in ("content-type", "etag", "last-modified", "retry-after")}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, status, headers, body) VALUES (?, ?, ?, ?)",
+                (key, status_code, json.dumps(headers), zlib.compress(content or b"", 6))
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, headers, body = row
+        return status, json.loads(headers), zlib.decompress(body)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class RecordingTransport:
+    """Ходит в сеть через requests.Session и сохраняет каждый ответ в архив"""
+
+    offline = False
+
+    def __init__(self, archive, session=None):
+        self.archive = archive
+        self._session = session or requests.Session()
+
+    def __getattr__(self, name):
+        # headers, cookies, mount и прочее - от настоящей сессии
+        return getattr(self._session, name)
+
+    def _record(self, method, url, params, response):
+        key = request_key(method, url, params)
+        self.archive.put(key, response.status_code, response.headers, response.content)
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self._record("GET", url, params, self._session.get(url, params=params, **kwargs))
+
+    def post(self, url, data=None, **kwargs):
+        return self._record("POST", url, None, self._session.post(url, data=data, **kwargs))
+
+
+class ReplayTransport:
+    """Отдает ответы из архива без обращения к сети"""
+
+    offline = True
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.headers = CaseInsensitiveDict()
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.misses = 0
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def _replay(self, method, url, params=None):
+        key = request_key(method, url, params)
+        stored = self.archive.get(key)
+        if stored is None:
+            self.misses += 1
+            return None
+        status_code, headers, content = stored
+        return ArchivedResponse(url, status_code, headers, content)
+
+    def get(self, url, params=None, **kwargs):
+        response = self._replay("GET", url, params)
+        if response is None:
+            logger.warning(f"Нет в архиве: GET {url} {params or ''}")
+            return ArchivedResponse(url, 404, {}, b"null")
+        return response
+
+    def post(self, url, data=None, **kwargs):
+        # Логин офлайн не нужен - если его нет в архиве, считаем успешным
+        return self._replay("POST", url) or ArchivedResponse(url, 200, {}, b"{}")
+
+
+def make_transport(mode=TRANSPORT_MODE, archive_path=ARCHIVE_PATH):
+    """Сессия для SessionManager в зависимости от режима: live / record / replay"""
+    if mode == "record":
+        logger.info(f"Режим записи ответов в {archive_path}")
+        return RecordingTransport(ResponseArchive(archive_path))
+    if mode == "replay":
+        logger.info(f"Режим воспроизведения ответов из {archive_path}")
+        return ReplayTransport(ResponseArchive(archive_path))
+    return requests.Session()